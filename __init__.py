@@ -2,10 +2,44 @@ from aiogram import executor, types
 from aiogram.dispatcher import Dispatcher
 from aiogram.dispatcher.storage import FSMContext
 
+import src.callbacks as callbacks
+import src.config as config
+from src.callbacks import CallbackRouter
 from src.config import create_dirs, dp, load_json
+from src.content import Content
 from src.database import Database
+from src.learn import LearnTemplates
+from src.metrics import Metrics
+from src.middlewares import (CallbackAckMiddleware, ChatLockMiddleware,
+                             MetricsMiddleware, UpdateRecorderMiddleware)
+from src.tgfiles import TGFile
 from src.user import AdminState, User, UserState
 
+# callback queries are dispatched by callback data prefix
+router = CallbackRouter(stale_toast='Эта кнопка больше не работает')
+
+# record incoming updates for replay, before other middlewares cancel any
+recorder = None
+
+if config.RECORD_PATH is not None:
+    recorder = UpdateRecorderMiddleware(config.RECORD_PATH, config.RECORD_SALT)
+    dp.middleware.setup(recorder)
+
+# answer callback queries at once, before they wait for the chat lock
+ack = CallbackAckMiddleware(router.toast)
+dp.middleware.setup(ack)
+# process updates of one chat one at a time
+dp.middleware.setup(ChatLockMiddleware())
+# record handler latencies
+dp.middleware.setup(MetricsMiddleware(router))
+
+# metrics collected on scrape
+Metrics.gauge('bot_fsm_states', 'Users by FSM state', dp.storage.count_states, 'state')
+Metrics.gauge('bot_user_answers', 'User answers waiting for review', Database.answers.count, 'status')
+Metrics.gauge('bot_files', 'Cached Telegram file ids', lambda: len(config.FILES))
+Metrics.gauge('bot_send_waiting', 'Bot API sends waiting for the scheduler', lambda: dp.bot.scheduler.waiting)
+Metrics.gauge('bot_callback_acks_pending', 'Callback queries being answered', lambda: len(ack.tasks))
+
 
 @dp.message_handler(commands=['start'])
 async def command_start(message: types.Message):
@@ -22,7 +56,7 @@ async def command_info(message: types.Message):
 @dp.message_handler(commands=['words'])
 async def command_words(message: types.Message):
     user = User(message.from_user.id)
-    await user.command_words(message)
+    await user.command_words(message, message.get_args().strip())
 
 
 @dp.message_handler(commands=['id'])
@@ -31,10 +65,11 @@ async def command_id(message: types.Message):
     await user.command_id()
 
 
-@dp.message_handler(commands=['answer'])
+@dp.message_handler(commands=['answer'], state='*')
 async def command_answer(message: types.Message):
     user = User(message.from_user.id)
-    await user.admin.command_answer()
+    args = message.get_args()
+    await user.admin.command_answer(int(args) if args.isdigit() else 1)
 
 
 @dp.message_handler(state=UserState.write_answer)
@@ -52,72 +87,125 @@ async def state_user_talk(message: types.Message, state: FSMContext):
 @dp.message_handler(state=AdminState.task_answer)
 async def state_admin_answer(message: types.Message, state: FSMContext):
     user = User(message.from_user.id)
-    await user.admin.answer(message.text, state)
+    reply_to = None
 
+    if message.reply_to_message:
+        reply_to = message.reply_to_message.message_id
 
-@dp.callback_query_handler(lambda call: call.data == 'menu_main_talk')
+    await user.admin.answer(message.text, state, reply_to)
+
+
+@router.route(callbacks.MENU_TALK)
 async def button_talk_task_start(call: types.CallbackQuery):
     user = User(call.from_user.id)
     await user.talk_task_start(call.message.message_id)
 
 
-@dp.callback_query_handler(lambda call: call.data == 'menu_main_write')
+@router.route(callbacks.MENU_WRITE)
 async def button_write_task_start(call: types.CallbackQuery):
     user = User(call.from_user.id)
     await user.write_task_start(call.message.message_id)
 
 
-@dp.callback_query_handler(lambda call: call.data == 'menu_main_listen')
+@router.route(callbacks.MENU_LISTEN)
 async def button_listen_task_start(call: types.CallbackQuery):
     user = User(call.from_user.id)
     await user.listen_task_start(call.message.message_id)
 
 
-@dp.callback_query_handler(lambda call: call.data == 'menu_main_read')
+@router.route(callbacks.MENU_READ)
 async def button_read_task_start(call: types.CallbackQuery):
     user = User(call.from_user.id)
     await user.read_task_start(call.message.message_id)
 
 
-@dp.callback_query_handler(lambda call: call.data.startswith('talk'))
-async def button_talk_task(call: types.CallbackQuery):
+@router.route(callbacks.TALK_NEXT, int)
+async def button_talk_task(call: types.CallbackQuery, task: int):
+    user = User(call.from_user.id)
+    await user.talk_task(call, task)
+
+
+@router.route(callbacks.TALK_ANSWER, int)
+async def button_talk_answer(call: types.CallbackQuery, task: int):
+    user = User(call.from_user.id)
+    await user.talk_answer_start(call)
+
+
+@router.route(callbacks.WRITE_NEXT, int)
+async def button_write_task(call: types.CallbackQuery, task: int):
+    user = User(call.from_user.id)
+    await user.write_task(call, task)
+
+
+@router.route(callbacks.WRITE_ANSWER, int)
+async def button_write_answer(call: types.CallbackQuery, task: int):
+    user = User(call.from_user.id)
+    await user.write_answer_start(call)
+
+
+@router.route(callbacks.LISTEN_NEXT, int)
+async def button_listen_task(call: types.CallbackQuery, task: int):
     user = User(call.from_user.id)
-    await user.talk_task(call)
+    await user.listen_task(call, task)
 
 
-@dp.callback_query_handler(lambda call: call.data.startswith('write'))
-async def button_write_task(call: types.CallbackQuery):
+@router.route(callbacks.LISTEN_ANSWERS, int)
+async def button_listen_answers(call: types.CallbackQuery, task: int):
     user = User(call.from_user.id)
-    await user.write_task(call)
+    await user.listen_answers(call, task)
 
 
-@dp.callback_query_handler(lambda call: call.data.startswith('listen'))
-async def button_listen_task(call: types.CallbackQuery):
+@router.route(callbacks.READ_NEXT, int)
+async def button_read_task(call: types.CallbackQuery, task: int):
     user = User(call.from_user.id)
-    await user.listen_task(call)
+    await user.read_task(call, task)
 
 
-@dp.callback_query_handler(lambda call: call.data.startswith('read'))
-async def button_read_task(call: types.CallbackQuery):
+@router.route(callbacks.READ_RESULT, int, bool)
+async def button_read_result(call: types.CallbackQuery, task: int, answer: bool):
     user = User(call.from_user.id)
-    await user.read_task(call)
+    await user.read_result(call, task, answer)
 
 
-@dp.callback_query_handler(lambda call: call.data.startswith('words'))
-async def button_words_page(call: types.CallbackQuery):
+@router.route(callbacks.WORDS_PAGE, int)
+async def button_words_page(call: types.CallbackQuery, page: int):
     user = User(call.from_user.id)
-    await user.words(call)
+    await user.words(call, page)
+
+
+@dp.inline_handler()
+async def inline_words(inline_query: types.InlineQuery):
+    user = User(inline_query.from_user.id)
+    await user.inline_words(inline_query)
+
+
+@dp.callback_query_handler()
+async def button(call: types.CallbackQuery):
+    await router.dispatch(call)
 
 
 async def startup(dp: Dispatcher):
     # create directories
     create_dirs()
 
-    # load json files
+    # load json files, watch learn content
     load_json()
+    await Content.start(LearnTemplates)
+
+    # index media files
+    await TGFile.index.start()
 
-    # create database
+    # create database, purge expired FSM states in the background
     await Database.create()
+    dp.storage.start()
+
+    # upload uncached task media in the background
+    if config.STORAGE_CHAT_ID is not None:
+        TGFile.warmup.start(config.STORAGE_CHAT_ID)
+
+    # serve metrics
+    if config.METRICS_PORT is not None:
+        await Metrics.start(config.METRICS_HOST, config.METRICS_PORT)
 
     # set commands
     await dp.bot.set_my_commands([
@@ -128,11 +216,55 @@ async def startup(dp: Dispatcher):
     # hidden commands: /id (Telegram id), /answer (check user answer and send reaction)
 
 
+async def shutdown(dp: Dispatcher):
+    # stop watchers and warm-up, write pending file ids
+    await Content.stop()
+    await TGFile.warmup.stop()
+    await TGFile.index.stop()
+    await TGFile.store.close()
+
+    # close database connections
+    await Database.close()
+
+    await Metrics.stop()
+
+    # write recorded updates
+    if recorder is not None:
+        await recorder.close()
+
+
+async def webhook_startup(dp: Dispatcher):
+    await startup(dp)
+
+    # register webhook
+    if config.WEBHOOK_URL is not None:
+        await dp.bot.set_webhook(config.WEBHOOK_URL)
+
+
+async def webhook_shutdown(dp: Dispatcher):
+    # remove webhook
+    if config.WEBHOOK_URL is not None:
+        await dp.bot.delete_webhook()
+
+    await shutdown(dp)
+
+
 def main():
-    # start bot polling
-    executor.start_polling(
-        dispatcher=dp,
-        on_startup=startup)
+    if config.WEBHOOK:
+        # start aiohttp server for webhook updates
+        executor.start_webhook(
+            dispatcher=dp,
+            webhook_path=config.WEBHOOK_PATH,
+            on_startup=webhook_startup,
+            on_shutdown=webhook_shutdown,
+            host=config.WEBAPP_HOST,
+            port=config.WEBAPP_PORT)
+    else:
+        # start bot polling
+        executor.start_polling(
+            dispatcher=dp,
+            on_startup=startup,
+            on_shutdown=shutdown)
 
 
 if __name__ == '__main__':
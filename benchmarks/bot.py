@@ -0,0 +1,336 @@
+"""
+End-to-end update throughput benchmark
+
+Starts a local fake Bot API server and feeds synthetic update streams
+through the real dispatcher: menu taps, read answers, listen, talk and
+write submissions, admin /answer loops and inline word searches.
+Reports throughput, update latency percentiles and Bot API calls per
+update.
+
+Run from the repository root: python -m benchmarks.bot
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 1
+USER_ID = 1000
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+
+from aiogram import Bot, types  # noqa: E402
+from aiogram.bot.api import TelegramAPIServer  # noqa: E402
+from aiogram.dispatcher import Dispatcher  # noqa: E402
+
+import src.callbacks as callbacks  # noqa: E402
+from benchmarks.fakeapi import FakeBotAPI  # noqa: E402
+from src.callbacks import CallbackData  # noqa: E402
+
+ids = itertools.count(1)
+
+
+def create_content(path: str, tasks: int, words: int):
+    """
+    Use this method to write synthetic learn content and media files
+
+    :param path: Working directory
+    :type path: :obj:`str`
+    :param tasks: Number of tasks per section
+    :type tasks: :obj:`int`
+    :param words: Number of words
+    :type words: :obj:`int`
+    """
+    for folder in ('data/json', 'data/img', 'data/vid'):
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+    for num in range(tasks):
+        with open(os.path.join(path, f'data/img/talk{num}.jpg'), 'wb') as media_file:
+            media_file.write(b'\xff\xd8' + bytes(1024))
+
+        with open(os.path.join(path, f'data/vid/listen{num}.mp4'), 'wb') as media_file:
+            media_file.write(bytes(4096))
+
+    learn = {
+        'ExamInfo': 'Benchmark exam info',
+        'Words': [f'das Wort{num} - слово{num}' for num in range(words)],
+        'Read': [{'text': f'Read task {num}', 'answers': ['richtig', 'falsch', 'nicht im Text']}
+                 for num in range(tasks)],
+        'Listen': [{'video': f'listen{num}.mp4', 'QA': ['Frage - Antwort'] * 3}
+                   for num in range(tasks)],
+        'Talk': [f'talk{num}.jpg' for num in range(tasks)],
+        'Write': [f'Write task {num}' for num in range(tasks)]}
+
+    with open(os.path.join(path, 'data/json/learn.json'), 'w', encoding='utf-8') as learn_file:
+        json.dump(learn, learn_file, ensure_ascii=False)
+
+
+def message(user_id: int, text: str) -> types.Update:
+    """
+    Use this method to build a text message update
+    """
+    msg = {
+        'message_id': next(ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'text': text}
+
+    if text.startswith('/'):
+        msg['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+
+    return types.Update(update_id=next(ids), message=msg)
+
+
+def callback(user_id: int, prefix: str, *args) -> types.Update:
+    """
+    Use this method to build a callback query update
+    """
+    return types.Update(update_id=next(ids), callback_query={
+        'id': str(next(ids)),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'chat_instance': str(user_id),
+        'data': CallbackData.pack(prefix, *args),
+        'message': {
+            'message_id': next(ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'}}})
+
+
+def inline_query(user_id: int, query: str) -> types.Update:
+    """
+    Use this method to build an inline query update
+    """
+    return types.Update(update_id=next(ids), inline_query={
+        'id': str(next(ids)),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+        'query': query,
+        'offset': ''})
+
+
+def scenario(name: str, user_id: int, tasks: int) -> list:
+    """
+    Use this method to build the updates one user sends in a scenario
+
+    :param name: Scenario name
+    :type name: :obj:`str`
+    :param user_id: User ID
+    :type user_id: :obj:`int`
+    :param tasks: Number of tasks per section
+    :type tasks: :obj:`int`
+
+    :return: Returns updates in the order they are sent
+    :rtype: :obj:`list`
+    """
+    task = random.randrange(tasks)
+
+    if name == 'menu':
+        return [message(user_id, '/start'), message(user_id, '/info'),
+                message(user_id, '/words'), callback(user_id, callbacks.WORDS_PAGE, 1)]
+
+    if name == 'read':
+        return [callback(user_id, callbacks.MENU_READ),
+                callback(user_id, callbacks.READ_RESULT, task, True),
+                callback(user_id, callbacks.READ_NEXT, task),
+                callback(user_id, callbacks.READ_RESULT, task, False)]
+
+    if name == 'listen':
+        return [callback(user_id, callbacks.MENU_LISTEN),
+                callback(user_id, callbacks.LISTEN_ANSWERS, task),
+                callback(user_id, callbacks.LISTEN_NEXT, task)]
+
+    if name == 'talk':
+        return [callback(user_id, callbacks.MENU_TALK),
+                callback(user_id, callbacks.TALK_ANSWER, task),
+                message(user_id, 'Ich heiße Anna und wohne in Berlin.'),
+                callback(user_id, callbacks.TALK_NEXT, task)]
+
+    if name == 'write':
+        return [callback(user_id, callbacks.MENU_WRITE),
+                callback(user_id, callbacks.WRITE_ANSWER, task),
+                message(user_id, 'Liebe Maria, vielen Dank für deinen Brief.'),
+                callback(user_id, callbacks.WRITE_NEXT, task)]
+
+    if name == 'inline':
+        word = f'wort{random.randrange(tasks)}'
+        return [inline_query(user_id, word[:size]) for size in range(1, len(word) + 1)]
+
+    raise ValueError(f'Unknown scenario: {name}')
+
+
+class Benchmark:
+    """
+    Base benchmark class
+    """
+
+    def __init__(self, dp: Dispatcher, api: FakeBotAPI) -> None:
+        self.dp = dp
+        self.api = api
+        self.latencies = []
+
+    async def process(self, update: types.Update):
+        """
+        Use this method to process an update and record its latency
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        # every update runs in its own task, as in Dispatcher.process_updates
+        await loop.create_task(self.dp.updates_handler.notify(update))
+
+        self.latencies.append(loop.time() - start)
+
+    async def user(self, updates: list):
+        """
+        Use this method to send updates of one user one after another
+        """
+        for update in updates:
+            await self.process(update)
+
+    async def admin(self, batch: int):
+        """
+        Use this method to review all answers with /answer loops
+        """
+        while True:
+            await self.process(message(ADMIN_ID, f'/answer {batch}'))
+
+            data = await self.dp.storage.get_data(chat=ADMIN_ID, user=ADMIN_ID)
+            review = data.get('review', [])
+
+            if not review:
+                return
+
+            for num in range(1, len(review) + 1):
+                await self.process(message(ADMIN_ID, f'{num} Sehr gut!'))
+
+    async def run(self, name: str, coroutines: list):
+        """
+        Use this method to run a scenario and print its statistics
+        """
+        self.latencies = []
+        calls = sum(self.api.calls.values())
+        start = time.perf_counter()
+
+        await asyncio.gather(*coroutines)
+        elapsed = time.perf_counter() - start
+
+        # let callback acknowledgements finish
+        await asyncio.sleep(self.api.latency + 0.01)
+
+        calls = sum(self.api.calls.values()) - calls
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(value: float) -> float:
+            return latencies[min(count - 1, int(count * value))] * 1e3
+
+        print(f'{name:8} {count:7} {count / elapsed:10.1f} '
+              f'{percentile(0.5):8.2f} {percentile(0.95):8.2f} {percentile(0.99):8.2f} '
+              f'{calls / count:10.2f}')
+
+
+async def start_bot(base_url: str, throttle: bool = False):
+    """
+    Use this method to load the bot, point it to a fake Bot API and start it
+
+    :param base_url: Fake Bot API base URL
+    :type base_url: :obj:`str`
+    :param throttle: Keep the Bot API send limits
+    :type throttle: :obj:`bool`
+
+    :return: Returns the bot module
+    :rtype: :obj:`types.ModuleType`
+    """
+    spec = importlib.util.spec_from_file_location('bot', os.path.join(ROOT, '__init__.py'))
+    bot_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot_module)
+
+    from src.sender import SendScheduler
+
+    dp = bot_module.dp
+    dp.bot.server = TelegramAPIServer.from_base(base_url)
+
+    if not throttle:
+        dp.bot.scheduler = SendScheduler(1e9, 1e9, 1e9)
+
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+
+    await bot_module.startup(dp)
+
+    return bot_module
+
+
+async def stop_bot(bot_module):
+    """
+    Use this method to stop the bot and close its connections
+
+    :param bot_module: Bot module
+    :type bot_module: :obj:`types.ModuleType`
+    """
+    dp = bot_module.dp
+
+    await bot_module.shutdown(dp)
+    await dp.storage.close()
+    await (await dp.bot.get_session()).close()
+
+
+async def run(args: argparse.Namespace):
+    api = FakeBotAPI(args.latency)
+    bot_module = await start_bot(await api.start(), args.throttle)
+
+    import src.config as config
+    from src.database import Database
+
+    dp = bot_module.dp
+    await Database.admins.add(ADMIN_ID)
+
+    benchmark = Benchmark(dp, api)
+    users = range(USER_ID, USER_ID + args.users)
+
+    print(f'{args.users} users, {args.latency * 1e3:.1f} ms Bot API latency, '
+          f'send limits {"on" if args.throttle else "off"}')
+    print(f'{"scenario":8} {"updates":>7} {"updates/s":>10} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"calls/upd":>10}')
+
+    for name in args.scenarios:
+        if name == 'answer':
+            await benchmark.run(name, [benchmark.admin(config.ANSWER_BATCH_SIZE)])
+        else:
+            await benchmark.run(name, [
+                benchmark.user(scenario(name, user_id, args.tasks)) for user_id in users])
+
+    await stop_bot(bot_module)
+    await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=50)
+    parser.add_argument('--words', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every Bot API call takes')
+    parser.add_argument('--throttle', action='store_true',
+                        help='keep the Bot API send limits')
+    parser.add_argument('--scenarios', nargs='+',
+                        default=['menu', 'read', 'listen', 'talk', 'write', 'answer', 'inline'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        create_content(path, args.tasks, args.words)
+        os.chdir(path)
+
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Local stand-in for the Telegram Bot API
+
+Answers the methods the bot uses with well-formed results after a
+configurable latency and counts calls per method.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+
+class FakeBotAPI:
+    """
+    Base fake Bot API server class
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        :param latency: Seconds every call takes
+        :type latency: :obj:`float`
+        """
+        self.latency = latency
+        self.calls = Counter()
+        self.runner = None
+
+        self.__message_ids = itertools.count(1)
+        self.__file_ids = itertools.count(1)
+
+    def message(self, method: str, data) -> dict:
+        """
+        Use this method to build a sent message
+
+        :param method: API method name
+        :type method: :obj:`str`
+        :param data: Request data
+        :type data: :obj:`typing.Mapping`
+
+        :return: Returns the message
+        :rtype: :obj:`dict`
+        """
+        message = {
+            'message_id': int(data.get('message_id') or next(self.__message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': int(data.get('chat_id') or 0), 'type': 'private'},
+            'from': BOT_USER}
+
+        if method == 'sendPhoto':
+            message['photo'] = [{
+                'file_id': f'photo{next(self.__file_ids)}', 'file_unique_id': 'photo',
+                'width': 1, 'height': 1}]
+        elif method == 'sendVideo':
+            message['video'] = {
+                'file_id': f'video{next(self.__file_ids)}', 'file_unique_id': 'video',
+                'width': 1, 'height': 1, 'duration': 1}
+        elif 'text' in data:
+            message['text'] = data['text']
+
+        return message
+
+    def result(self, method: str, data):
+        """
+        Use this method to build the result of an API call
+
+        :param method: API method name
+        :type method: :obj:`str`
+        :param data: Request data
+        :type data: :obj:`typing.Mapping`
+
+        :return: Returns the result
+        :rtype: :obj:`typing.Any`
+        """
+        if method == 'getMe':
+            return BOT_USER
+
+        if method == 'sendMediaGroup':
+            return [self.message('sendPhoto', data) for _ in json.loads(data['media'])]
+
+        if method.startswith(('send', 'edit', 'copy', 'forward')):
+            return self.message(method, data)
+
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        data = await request.post()
+
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return web.json_response({'ok': True, 'result': self.result(method, data)})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Use this method to start the server
+
+        :param host: Host to listen on
+        :type host: :obj:`str`
+        :param port: Port to listen on, 0 picks a free port
+        :type port: :obj:`int`
+
+        :return: Returns the server base URL
+        :rtype: :obj:`str`
+        """
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        """
+        Use this method to stop the server
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,345 @@
+"""
+Replay of recorded update traffic
+
+Feeds an update log written by the recorder (config.RECORD_PATH)
+through the real dispatcher against a local fake Bot API, at the
+recorded pace or as fast as possible, and reports throughput and update
+latency. Results saved with --output in two builds are compared with
+--compare.
+
+Run from the repository root:
+    python -m benchmarks.replay updates.ndjson.gz --output new.json
+    python -m benchmarks.replay --compare base.json new.json
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from aiogram import types
+
+import src.callbacks as callbacks
+from benchmarks.bot import ROOT, create_content, start_bot, stop_bot
+from benchmarks.fakeapi import FakeBotAPI
+from src.callbacks import CallbackData
+
+# callback prefixes whose first argument is a task number
+TASK_PREFIXES = (callbacks.TALK_NEXT, callbacks.TALK_ANSWER, callbacks.WRITE_NEXT,
+                 callbacks.WRITE_ANSWER, callbacks.LISTEN_NEXT, callbacks.LISTEN_ANSWERS,
+                 callbacks.READ_NEXT, callbacks.READ_RESULT)
+
+
+def load_log(path: str) -> list:
+    """
+    Use this method to read a recorded update log
+
+    :param path: Log file path
+    :type path: :obj:`str`
+
+    :return: Returns (arrival time, update data) pairs in arrival order
+    :rtype: :obj:`list`
+    """
+    records = []
+
+    with gzip.open(path, 'rt', encoding='utf-8') as log_file:
+        for line in log_file:
+            if line.strip():
+                record = json.loads(line)
+                records.append((record['time'], record['update']))
+
+    return records
+
+
+def inspect_log(records: list):
+    """
+    Use this method to find the admins and the task count a log needs
+
+    Users who sent /answer are replayed as admins.
+
+    :param records: Recorded updates
+    :type records: :obj:`list`
+
+    :return: Returns admin IDs and the number of tasks per section
+    :rtype: :obj:`typing.Tuple[set, int]`
+    """
+    admins = set()
+    tasks = 0
+
+    for _, update in records:
+        message = update.get('message')
+
+        if message is not None and message.get('text', '').startswith('/answer'):
+            admins.add(message['from']['id'])
+
+        call = update.get('callback_query')
+        unpacked = CallbackData.unpack(call.get('data')) if call is not None else None
+
+        if unpacked is not None and unpacked[0] in TASK_PREFIXES and unpacked[1]:
+            if unpacked[1][0].isdigit():
+                tasks = max(tasks, int(unpacked[1][0]) + 1)
+
+    return admins, tasks
+
+
+def create_learn(path: str, learn_path: str):
+    """
+    Use this method to replace synthetic content with a learn.json and
+    write placeholder media files it refers to
+
+    :param path: Working directory
+    :type path: :obj:`str`
+    :param learn_path: learn.json path
+    :type learn_path: :obj:`str`
+    """
+    with open(learn_path, encoding='utf-8') as learn_file:
+        learn = json.load(learn_file)
+
+    with open(os.path.join(path, 'data/json/learn.json'), 'w', encoding='utf-8') as learn_file:
+        json.dump(learn, learn_file, ensure_ascii=False)
+
+    for image in learn.get('Talk', []):
+        with open(os.path.join(path, 'data/img', image), 'wb') as media_file:
+            media_file.write(b'\xff\xd8' + bytes(1024))
+
+    for task in learn.get('Listen', []):
+        with open(os.path.join(path, 'data/vid', task['video']), 'wb') as media_file:
+            media_file.write(bytes(4096))
+
+
+def build() -> str:
+    """
+    Use this method to describe the build under test
+
+    :return: Returns the git revision, or the repository path outside git
+    :rtype: :obj:`str`
+    """
+    try:
+        return subprocess.run(
+            ['git', '-C', ROOT, 'describe', '--always', '--dirty'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ROOT
+
+
+def percentiles(latencies: list) -> dict:
+    """
+    Use this method to summarise latencies in milliseconds
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    if not count:
+        return {}
+
+    return {name: round(latencies[min(count - 1, int(count * value))] * 1e3, 3)
+            for name, value in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))}
+
+
+class Replay:
+    """
+    Base replay class
+    """
+
+    def __init__(self, dp, api: FakeBotAPI, speed: float, concurrency: int) -> None:
+        """
+        :param dp: Dispatcher
+        :type dp: :obj:`Dispatcher`
+        :param api: Fake Bot API
+        :type api: :obj:`FakeBotAPI`
+        :param speed: Pace relative to the recording, 0 replays as fast as possible
+        :type speed: :obj:`float`
+        :param concurrency: Maximum number of updates in progress
+        :type concurrency: :obj:`int`
+        """
+        self.dp = dp
+        self.api = api
+        self.speed = speed
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.latencies = {}
+        self.errors = 0
+
+    async def process(self, kind: str, update: types.Update):
+        """
+        Use this method to process an update and record its latency
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        try:
+            await self.dp.updates_handler.notify(update)
+        except Exception:
+            self.errors += 1
+        finally:
+            self.latencies.setdefault(kind, []).append(loop.time() - start)
+            self.semaphore.release()
+
+    async def run(self, records: list) -> dict:
+        """
+        Use this method to replay updates and summarise the results
+
+        :param records: Recorded updates
+        :type records: :obj:`list`
+
+        :return: Returns the results
+        :rtype: :obj:`dict`
+        """
+        loop = asyncio.get_running_loop()
+        calls = sum(self.api.calls.values())
+        tasks = []
+        origin = records[0][0] if records else 0.0
+        start = loop.time()
+
+        for arrival, data in records:
+            if self.speed:
+                delay = start + (arrival - origin) / self.speed - loop.time()
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # updates start in arrival order, so the chat lock keeps their order
+            await self.semaphore.acquire()
+            kind = next(key for key in data if key != 'update_id')
+            tasks.append(loop.create_task(self.process(kind, types.Update.to_object(data))))
+
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+
+        # let callback acknowledgements finish
+        await asyncio.sleep(self.api.latency + 0.01)
+
+        count = len(records)
+        latencies = [value for values in self.latencies.values() for value in values]
+
+        return {
+            'build': build(),
+            'updates': count,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'updates_per_second': round(count / elapsed, 1) if elapsed else 0.0,
+            'calls_per_update': round((sum(self.api.calls.values()) - calls) / count, 3) if count else 0.0,
+            'latency_ms': percentiles(latencies),
+            'kinds': {kind: {'updates': len(values), 'latency_ms': percentiles(values)}
+                      for kind, values in sorted(self.latencies.items())}}
+
+
+def report(results: dict):
+    """
+    Use this method to print replay results
+    """
+    print(f'build {results["build"]}: {results["updates"]} updates, {results["errors"]} errors, '
+          f'{results["seconds"]} s, {results["updates_per_second"]} updates/s, '
+          f'{results["calls_per_update"]} calls/update')
+    print(f'{"kind":16} {"updates":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+
+    for kind, stats in (('all', {'updates': results['updates'], 'latency_ms': results['latency_ms']}),
+                        *results['kinds'].items()):
+        latency = stats['latency_ms']
+
+        if latency:
+            print(f'{kind:16} {stats["updates"]:7} {latency["p50"]:8.2f} {latency["p95"]:8.2f} '
+                  f'{latency["p99"]:8.2f} {latency["max"]:8.2f}')
+
+
+def compare(base: dict, new: dict):
+    """
+    Use this method to print the difference between two replay results
+    """
+    print(f'{"metric":24} {base["build"]:>14} {new["build"]:>14} {"change":>8}')
+
+    rows = [('updates/s', base['updates_per_second'], new['updates_per_second']),
+            ('calls/update', base['calls_per_update'], new['calls_per_update']),
+            ('errors', base['errors'], new['errors'])]
+
+    for kind in ('all', *sorted(set(base['kinds']) & set(new['kinds']))):
+        base_latency = base['latency_ms'] if kind == 'all' else base['kinds'][kind]['latency_ms']
+        new_latency = new['latency_ms'] if kind == 'all' else new['kinds'][kind]['latency_ms']
+
+        for name in ('p50', 'p95', 'p99'):
+            if name in base_latency and name in new_latency:
+                rows.append((f'{kind} {name} ms', base_latency[name], new_latency[name]))
+
+    for name, base_value, new_value in rows:
+        change = f'{(new_value - base_value) / base_value * 100:+.1f}%' if base_value else '-'
+        print(f'{name:24} {base_value:14} {new_value:14} {change:>8}')
+
+
+async def run(args: argparse.Namespace, records: list, admins: set) -> dict:
+    api = FakeBotAPI(args.latency)
+    bot_module = await start_bot(await api.start(), args.throttle)
+
+    from src.database import Database
+
+    for admin_id in admins:
+        await Database.admins.add(admin_id)
+
+    results = await Replay(bot_module.dp, api, args.speed, args.concurrency).run(records)
+
+    await stop_bot(bot_module)
+    await api.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', nargs='?', help='recorded update log')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='pace relative to the recording: 1 replays at the original speed, '
+                             '0 as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='maximum number of updates in progress')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every Bot API call takes')
+    parser.add_argument('--throttle', action='store_true',
+                        help='keep the Bot API send limits')
+    parser.add_argument('--learn', help='learn.json to replay against, synthetic content if not set')
+    parser.add_argument('--tasks', type=int, default=50,
+                        help='minimum number of synthetic tasks per section')
+    parser.add_argument('--words', type=int, default=500)
+    parser.add_argument('--output', help='file to save the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two saved results instead of replaying')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as base_file, \
+                open(args.compare[1], encoding='utf-8') as new_file:
+            compare(json.load(base_file), json.load(new_file))
+        return
+
+    if args.log is None:
+        parser.error('a log or --compare is required')
+
+    records = load_log(args.log)
+    admins, tasks = inspect_log(records)
+    output = os.path.abspath(args.output) if args.output else None
+    learn = os.path.abspath(args.learn) if args.learn else None
+
+    with tempfile.TemporaryDirectory() as path:
+        create_content(path, max(args.tasks, tasks), args.words)
+
+        if learn is not None:
+            create_learn(path, learn)
+
+        os.chdir(path)
+        started = time.time()
+        results = asyncio.run(run(args, records, admins))
+
+    results['log'] = args.log
+    results['speed'] = args.speed
+    results['started'] = round(started)
+
+    report(results)
+
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Word search benchmark
+
+Builds the search index over a synthetic vocabulary of compound-like
+German words with Russian translations and times inline prefix search
+and fuzzy /words search of misspelled words, one query at a time.
+
+Run from the repository root: python -m benchmarks.search
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+
+from src.content import Word  # noqa: E402
+from src.words import WordIndex  # noqa: E402
+
+SYLLABLES = ('ab', 'an', 'ar', 'bahn', 'be', 'beit', 'bü', 'che', 'dung', 'ein', 'end',
+             'er', 'fahr', 'ge', 'gen', 'haus', 'hof', 'kind', 'kran', 'ken', 'kü', 'le',
+             'leh', 'lich', 'mel', 'mor', 'platz', 'rad', 'rer', 'ro', 'sch', 'schu',
+             'spiel', 'stra', 'sse', 'tag', 'ten', 'ung', 'ver', 'wo', 'woh', 'zeit')
+RUSSIAN_SYLLABLES = ('бо', 'ве', 'вок', 'вре', 'да', 'дом', 'зал', 'иг', 'ла', 'ма', 'мя',
+                     'ра', 'ро', 'ста', 'та', 'ули', 'ут', 'ца', 'чер', 'шко')
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    """
+    Use this method to build distinct synthetic words
+
+    :param size: Number of words
+    :type size: :obj:`int`
+    :param rng: Random generator
+    :type rng: :obj:`random.Random`
+
+    :return: Returns the words
+    :rtype: :obj:`list`
+    """
+    seen = set()
+    words = []
+
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+        if word not in seen:
+            seen.add(word)
+            translation = ''.join(rng.choice(RUSSIAN_SYLLABLES) for _ in range(rng.randint(2, 4)))
+            words.append(Word(f'{rng.choice(("der", "die", "das"))} {word} - {translation}'))
+
+    return words
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """
+    Use this method to make one typo: a missing, extra, wrong or swapped letter
+    """
+    letters = list(word)
+    i = rng.randrange(len(letters))
+    typo = rng.choice(('missing', 'extra', 'wrong', 'swapped'))
+
+    if typo == 'missing':
+        del letters[i]
+    elif typo == 'extra':
+        letters.insert(i, rng.choice('aeinrst'))
+    elif typo == 'wrong':
+        letters[i] = rng.choice('aeinrst')
+    elif i < len(letters) - 1:
+        letters[i], letters[i + 1] = letters[i + 1], letters[i]
+
+    return ''.join(letters)
+
+
+def timings(queries: list, search) -> list:
+    """
+    Use this method to time a search function on every query
+
+    :return: Returns sorted latencies in seconds
+    :rtype: :obj:`list`
+    """
+    latencies = []
+
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+
+    return sorted(latencies)
+
+
+def report(name: str, latencies: list):
+    count = len(latencies)
+    mean = sum(latencies) / count
+
+    print(f'{name:18} {mean * 1e3:8.3f} {latencies[count // 2] * 1e3:8.3f} '
+          f'{latencies[min(count - 1, int(count * 0.99))] * 1e3:8.3f} {latencies[-1] * 1e3:8.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--count', type=int, default=10,
+                        help='results of one fuzzy search')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(args.words, rng)
+
+    start = time.perf_counter()
+    index = WordIndex(words, cache_size=args.queries)
+    build = time.perf_counter() - start
+
+    targets = [rng.choice(words) for _ in range(args.queries)]
+    exact = [word.word.split()[-1] for word in targets]
+    typos = [misspell(word, rng) for word in exact]
+    prefixes = [word[:rng.randint(1, len(word))] for word in exact]
+
+    def prefix(query: str):
+        index.cache.clear()
+        index.search(query)
+
+    print(f'{args.words} words, {len(index.tokens)} tokens, index built in {build:.3f} s')
+    print(f'{"query":18} {"mean ms":>8} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+
+    report('prefix, uncached', timings(prefixes, prefix))
+
+    for query in prefixes:
+        index.search(query)
+
+    report('prefix, cached', timings(prefixes, index.search))
+    report('fuzzy, exact', timings(exact, lambda query: index.closest(query, args.count)))
+    report('fuzzy, one typo', timings(typos, lambda query: index.closest(query, args.count)))
+
+    found = sum(word in index.closest(typo, args.count) for word, typo in zip(targets, typos))
+    print(f'misspelled words found in the top {args.count}: {found / args.queries:.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+/words page rendering benchmark
+
+Run from the repository root: python -m benchmarks.words
+"""
+import argparse
+import timeit
+
+from aiogram.types.inline_keyboard import (InlineKeyboardButton,
+                                           InlineKeyboardMarkup)
+
+from src.words import WordPages
+
+
+def render_per_call(words: list, page: int, count: int):
+    """
+    Use this method to render a page the way Learn.words did before
+    pages were cached
+    """
+    inline_keyboard = InlineKeyboardMarkup()
+    fst_word = page * count
+    until_word = min((page + 1) * count, len(words))
+    buttons = []
+
+    msg_text = f'<b>Страница {page + 1}</b>\n'
+
+    for word in words[fst_word:until_word]:
+        msg_text += f'\n{word}'
+
+    if fst_word != 0:
+        buttons.append(
+            InlineKeyboardButton(
+                text='« Назад',
+                callback_data=f'words_{page - 1}'))
+
+    if until_word < len(words):
+        buttons.append(
+            InlineKeyboardButton(
+                text='Далее »',
+                callback_data=f'words_{page + 1}'))
+
+    inline_keyboard.add(*buttons)
+
+    return msg_text, inline_keyboard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--words', type=int, default=5000)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    words = [f'das Wort{num} - слово{num}' for num in range(args.words)]
+    page_total = -(-args.words // args.count)
+
+    build = timeit.timeit(
+        lambda: WordPages(words, args.count), number=10) / 10
+    pages = WordPages(words, args.count)
+
+    pages_iter = iter(range(10 ** 9))
+    per_call = timeit.timeit(
+        lambda: render_per_call(words, next(pages_iter) % page_total, args.count),
+        number=args.number) / args.number
+
+    pages_iter = iter(range(10 ** 9))
+    cached = timeit.timeit(
+        lambda: pages.get(next(pages_iter) % page_total),
+        number=args.number) / args.number
+
+    print(f'{args.words} words, {page_total} pages of {args.count}')
+    print(f'build all pages:  {build * 1e3:10.3f} ms')
+    print(f'render per call:  {per_call * 1e6:10.3f} us')
+    print(f'cached lookup:    {cached * 1e6:10.3f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import typing
+
+from aiogram import types
+
+# callback data format version, the first character of packed data
+VERSION = '1'
+# Telegram limit of callback data length in bytes
+MAX_DATA_LENGTH = 64
+
+MENU_TALK = 'mt'
+MENU_WRITE = 'mw'
+MENU_LISTEN = 'ml'
+MENU_READ = 'mr'
+TALK_NEXT = 'tn'
+TALK_ANSWER = 'ta'
+WRITE_NEXT = 'wn'
+WRITE_ANSWER = 'wa'
+LISTEN_NEXT = 'ln'
+LISTEN_ANSWERS = 'la'
+READ_NEXT = 'rn'
+READ_RESULT = 'rr'
+WORDS_PAGE = 'wp'
+
+# callback data sent before versioning, as "read_3_correct": words of
+# the data without numbers -> prefix and arguments following the numbers
+LEGACY = {
+    ('menu', 'main', 'talk'): (MENU_TALK,),
+    ('menu', 'main', 'write'): (MENU_WRITE,),
+    ('menu', 'main', 'listen'): (MENU_LISTEN,),
+    ('menu', 'main', 'read'): (MENU_READ,),
+    ('talk',): (TALK_NEXT,),
+    ('talk', 'answer'): (TALK_ANSWER,),
+    ('write',): (WRITE_NEXT,),
+    ('write', 'answer'): (WRITE_ANSWER,),
+    ('listen',): (LISTEN_NEXT,),
+    ('listen', 'answers'): (LISTEN_ANSWERS,),
+    ('read',): (READ_NEXT,),
+    ('read', 'correct'): (READ_RESULT, '1'),
+    ('read', 'wrong'): (READ_RESULT, '0'),
+    ('words',): (WORDS_PAGE,),
+}
+
+
+class CallbackData:
+    """
+    Base callback data codec class
+
+    Data is packed as the version, the action prefix and arguments
+    separated by colons, as "1rr:3:1".
+    """
+
+    def pack(prefix: str, *args) -> str:
+        """
+        Use this method to pack callback data
+
+        :param prefix: Action prefix
+        :type prefix: :obj:`str`
+        :param args: Action arguments
+        :type args: :obj:`typing.Union[int, bool, str]`
+
+        :return: Returns the callback data
+        :rtype: :obj:`str`
+
+        :raises ValueError: If the data exceeds the Telegram limit
+        """
+        data = VERSION + prefix + ''.join(
+            f':{int(arg) if isinstance(arg, bool) else arg}' for arg in args)
+
+        if len(data.encode()) > MAX_DATA_LENGTH:
+            raise ValueError(f'Callback data is too long: {data}')
+
+        return data
+
+    def unpack(data: str) -> typing.Optional[typing.Tuple[str, typing.List[str]]]:
+        """
+        Use this method to unpack callback data, including legacy data
+
+        :param data: Callback data
+        :type data: :obj:`str`
+
+        :return: Returns the action prefix and arguments, None for unknown data
+        :rtype: :obj:`typing.Optional[typing.Tuple[str, typing.List[str]]]`
+        """
+        if not data:
+            return None
+
+        if data[0] == VERSION:
+            prefix, *args = data[1:].split(':')
+            return prefix, args
+
+        words = data.split('_')
+        legacy = LEGACY.get(tuple(word for word in words if not word.isdigit()))
+
+        if legacy is None:
+            return None
+
+        return legacy[0], [word for word in words if word.isdigit()] + list(legacy[1:])
+
+
+class CallbackRouter:
+    """
+    Base callback router class
+
+    Callback queries are dispatched by action prefix in one lookup, and
+    handlers get the call and the arguments converted to their types.
+    """
+
+    def __init__(self, stale_toast: typing.Optional[str] = None) -> None:
+        """
+        :param stale_toast: Notification text for unknown callback data
+        :type stale_toast: :obj:`typing.Optional[str]`
+        """
+        self.routes = {}
+        self.toasts = {}
+        self.stale_toast = stale_toast
+
+    def route(self, prefix: str, *arg_types: type, toast: typing.Optional[str] = None):
+        """
+        Use this method to register a callback handler
+
+        :param prefix: Action prefix
+        :type prefix: :obj:`str`
+        :param arg_types: Argument types: int, bool or str
+        :type arg_types: :obj:`type`
+        :param toast: Notification text shown when the callback is answered
+        :type toast: :obj:`typing.Optional[str]`
+
+        :return: Returns a decorator
+        :rtype: :obj:`typing.Callable`
+        """
+        def decorator(handler: typing.Callable):
+            self.routes[prefix] = (handler, arg_types)
+            self.toasts[prefix] = toast
+            return handler
+
+        return decorator
+
+    def toast(self, call: types.CallbackQuery) -> typing.Optional[str]:
+        """
+        Use this method to get the notification text of a callback query
+
+        :param call: Callback query
+        :type call: :obj:`types.CallbackQuery`
+
+        :return: Returns the notification text, None for no notification
+        :rtype: :obj:`typing.Optional[str]`
+        """
+        unpacked = CallbackData.unpack(call.data)
+
+        if unpacked is None or unpacked[0] not in self.routes:
+            return self.stale_toast
+
+        return self.toasts[unpacked[0]]
+
+    def resolve(self, call: types.CallbackQuery):
+        """
+        Use this method to find the handler of a callback query
+
+        :param call: Callback query
+        :type call: :obj:`types.CallbackQuery`
+
+        :return: Returns the handler and its arguments, None for unknown data
+        :rtype: :obj:`typing.Optional[typing.Tuple[typing.Callable, list]]`
+        """
+        unpacked = CallbackData.unpack(call.data)
+
+        if unpacked is None:
+            return None
+
+        prefix, args = unpacked
+        route = self.routes.get(prefix)
+
+        if route is None or len(args) != len(route[1]):
+            return None
+
+        handler, arg_types = route
+
+        try:
+            args = [bool(int(arg)) if arg_type is bool else arg_type(arg)
+                    for arg, arg_type in zip(args, arg_types)]
+        except ValueError:
+            return None
+
+        return handler, args
+
+    async def dispatch(self, call: types.CallbackQuery):
+        """
+        Use this method to process a callback query
+
+        :param call: Callback query
+        :type call: :obj:`types.CallbackQuery`
+
+        :return: Returns the handler result, None for unknown data
+        :rtype: :obj:`typing.Any`
+        """
+        resolved = self.resolve(call)
+
+        if resolved is None:
+            return None
+
+        handler, args = resolved
+
+        return await handler(call, *args)
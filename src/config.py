@@ -1,26 +1,88 @@
 import json
 import os
 
-from aiogram import Bot
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import Dispatcher
 
-BOT_TOKEN = ''
+from src.sender import SendScheduler, ThrottledBot
+from src.storage import SQLiteStorage
+
+# token from @BotFather, or the BOT_TOKEN environment variable
+BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
+
+# serve updates from a local aiohttp endpoint instead of polling
+WEBHOOK = False
+# public URL registered with Telegram, None leaves the webhook unchanged
+WEBHOOK_URL = None
+WEBHOOK_PATH = '/webhook'
+WEBAPP_HOST = '127.0.0.1'
+WEBAPP_PORT = 8080
+
+# serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, None disables it
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+# append anonymised incoming updates to a gzip log for benchmarks.replay, None disables it;
+# message texts are kept, IDs and names are replaced with keyed hashes
+RECORD_PATH = None
+# key of the ID hashes, None picks a random key on every start
+RECORD_SALT = None
+
+# Bot API flood limits: sends per second overall and to one chat
+SEND_RATE = 30
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_RETRIES = 3
+
+DB_PATH = 'db/users.db'
+DB_POOL_SIZE = 4
+# FULL syncs every commit to disk, user answers are confirmed only after it
+DB_SYNCHRONOUS = 'FULL'
+# seconds between admin cache refreshes, None disables refreshing
+ADMINS_CACHE_TTL = 5 * 60
+
+# seconds an admin holds a claimed answer before it returns to the queue
+ANSWER_LEASE_TIMEOUT = 15 * 60
+# maximum number of answers an admin reviews at once (/answer <count>)
+ANSWER_BATCH_SIZE = 30
+# seconds to collect incoming answers before one commit, maximum answers per commit
+ANSWER_BUFFER_DELAY = 0.005
+ANSWER_BUFFER_SIZE = 100
+
+# FSM states and pending answers
+STORAGE_PATH = 'db/storage.db'
+STORAGE_CACHE_SIZE = 10000
+STORAGE_TTL = 7 * 24 * 60 * 60
+
+LEARN_PATH = 'data/json/learn.json'
+# compiled learn content, rebuilt when learn.json changes
+LEARN_CACHE_PATH = 'db/learn.pickle'
+# seconds between learn content reload checks, None disables reloading
+CONTENT_SCAN_INTERVAL = 5
+# /words page sizes rendered when the learn content loads
+WORDS_PAGE_SIZES = (10,)
+# inline word search (inline mode is enabled with @BotFather): maximum results, cached queries
+WORDS_SEARCH_LIMIT = 100
+WORDS_SEARCH_CACHE_SIZE = 1000
+# closest words shown for /words <query>
+WORDS_SEARCH_COUNT = 10
 
-ANSWERS = {}
-ADMIN_ANSWERS = {}
 FILES: json
+# seconds to collect file id updates before writing id.json
+FILES_FLUSH_DELAY = 5
+# seconds between media folder rescans, None disables rescanning
+MEDIA_SCAN_INTERVAL = 60
+# chat to upload uncached task media to at startup, None disables warm-up
+STORAGE_CHAT_ID = None
 
-bot = Bot(BOT_TOKEN)
-storage = MemoryStorage()
+bot = ThrottledBot(
+    BOT_TOKEN,
+    SendScheduler(SEND_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST),
+    SEND_RETRIES)
+storage = SQLiteStorage(STORAGE_PATH, STORAGE_CACHE_SIZE, STORAGE_TTL)
 dp = Dispatcher(bot=bot, storage=storage)
 
 
 def load_json():
-    global LEARN, FILES
-
-    with open('data/json/learn.json', 'r', encoding='utf-8') as learn_file:
-        LEARN = json.load(learn_file)
+    global FILES
 
     if not os.path.exists('data/json/id.json'):
         with open(f'data/json/id.json', 'w', encoding='utf-8') as id_file:
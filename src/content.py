@@ -0,0 +1,432 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import typing
+
+import src.config as config
+
+log = logging.getLogger(__name__)
+
+# bump when records change, cached content of other versions is compiled again
+COMPILER_VERSION = 1
+
+SECTIONS = ('ExamInfo', 'Words', 'Read', 'Listen', 'Talk', 'Write')
+# sections whose task numbers are kept in keyboards, FSM data and answers
+TASK_SECTIONS = ('Read', 'Listen', 'Talk', 'Write')
+
+
+class ReadTask:
+    """
+    Base read task class
+    """
+
+    __slots__ = ('text', 'answers', 'row_width')
+
+    def __init__(self, text: str, answers: typing.Tuple[str, ...], row_width: int = 3) -> None:
+        """
+        :param text: Task text
+        :type text: :obj:`str`
+        :param answers: Answers, the correct one first
+        :type answers: :obj:`typing.Tuple[str, ...]`
+        :param row_width: Number of answer buttons in a row
+        :type row_width: :obj:`int`
+        """
+        self.text = text
+        self.answers = answers
+        self.row_width = row_width
+
+
+class ListenTask:
+    """
+    Base listen task class
+    """
+
+    __slots__ = ('video', 'qa')
+
+    def __init__(self, video: str, qa: typing.Tuple[str, ...]) -> None:
+        """
+        :param video: Video file name
+        :type video: :obj:`str`
+        :param qa: Questions with answers
+        :type qa: :obj:`typing.Tuple[str, ...]`
+        """
+        self.video = video
+        self.qa = qa
+
+
+class TalkTask:
+    """
+    Base talk task class
+    """
+
+    __slots__ = ('image',)
+
+    def __init__(self, image: str) -> None:
+        """
+        :param image: Image file name
+        :type image: :obj:`str`
+        """
+        self.image = image
+
+
+class WriteTask:
+    """
+    Base write task class
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str) -> None:
+        """
+        :param text: Task text
+        :type text: :obj:`str`
+        """
+        self.text = text
+
+
+class Word:
+    """
+    Base word class
+    """
+
+    __slots__ = ('text', 'word', 'translation')
+
+    def __init__(self, text: str) -> None:
+        """
+        :param text: Word with translation, as "word - translation"
+        :type text: :obj:`str`
+        """
+        word, _, translation = text.partition(' - ')
+
+        self.text = text
+        self.word = word.strip()
+        self.translation = translation.strip()
+
+
+class LearnContent:
+    """
+    Base learn content class
+
+    Compiled learn.json, records are shared between updates and must
+    not be modified.
+    """
+
+    __slots__ = ('exam_info', 'words', 'read', 'listen', 'talk', 'write')
+
+    def __init__(self, exam_info: str, words: typing.Tuple[Word, ...],
+                 read: typing.Tuple[ReadTask, ...], listen: typing.Tuple[ListenTask, ...],
+                 talk: typing.Tuple[TalkTask, ...], write: typing.Tuple[WriteTask, ...]) -> None:
+        """
+        :param exam_info: Exam info text
+        :type exam_info: :obj:`str`
+        :param words: Words with translation
+        :type words: :obj:`typing.Tuple[Word, ...]`
+        :param read: Read tasks
+        :type read: :obj:`typing.Tuple[ReadTask, ...]`
+        :param listen: Listen tasks
+        :type listen: :obj:`typing.Tuple[ListenTask, ...]`
+        :param talk: Talk tasks
+        :type talk: :obj:`typing.Tuple[TalkTask, ...]`
+        :param write: Write tasks
+        :type write: :obj:`typing.Tuple[WriteTask, ...]`
+        """
+        self.exam_info = exam_info
+        self.words = words
+        self.read = read
+        self.listen = listen
+        self.talk = talk
+        self.write = write
+
+    def tasks(self, section: str) -> tuple:
+        """
+        Use this method to get the tasks of a learn section
+
+        :param section: Learn section name, as in learn.json
+        :type section: :obj:`str`
+
+        :return: Returns the section tasks
+        :rtype: :obj:`tuple`
+        """
+        return getattr(self, section.lower())
+
+
+class ContentSnapshot:
+    """
+    Base learn content snapshot class
+
+    A snapshot is never modified. A handler takes the current snapshot
+    once and uses it to the end, so a reload never mixes two versions.
+    """
+
+    __slots__ = ('learn', 'templates', 'digests')
+
+    def __init__(self, learn: LearnContent, templates, digests: typing.Dict[str, str]) -> None:
+        """
+        :param learn: Compiled learn content
+        :type learn: :obj:`LearnContent`
+        :param templates: Templates built from the content
+        :type templates: :obj:`LearnTemplates`
+        :param digests: Content digests by section name
+        :type digests: :obj:`typing.Dict[str, str]`
+        """
+        self.learn = learn
+        self.templates = templates
+        self.digests = digests
+
+
+class Content:
+    """
+    Base learn content class
+
+    learn.json is compiled into records off the event loop and swapped
+    in as a new snapshot. Compiled content is cached in a pickle keyed by
+    the source hash, so an unchanged file is not parsed again. The file
+    is checked every CONTENT_SCAN_INTERVAL seconds, and templates are
+    rebuilt only for the changed sections.
+    """
+
+    current = None
+    builder = None
+    mtime = None
+    task = None
+
+    def compile(learn) -> LearnContent:
+        """
+        Use this method to check parsed learn content and compile it into records
+
+        :param learn: Parsed learn content
+        :type learn: :obj:`dict`
+
+        :return: Returns the compiled content
+        :rtype: :obj:`LearnContent`
+
+        :raises ValueError: If the content is not valid
+        """
+        def strings(value) -> bool:
+            return (isinstance(value, list) and len(value) > 0
+                    and all(isinstance(item, str) and item for item in value))
+
+        if not isinstance(learn, dict):
+            raise ValueError('learn content must be an object')
+
+        for section in SECTIONS:
+            if section not in learn:
+                raise ValueError(f'{section}: section is missing')
+
+        if not isinstance(learn['ExamInfo'], str) or not learn['ExamInfo']:
+            raise ValueError('ExamInfo: must be a non-empty string')
+
+        for section in ('Words', 'Talk', 'Write'):
+            if not strings(learn[section]):
+                raise ValueError(f'{section}: must be a non-empty list of strings')
+
+        for section in ('Read', 'Listen'):
+            if not isinstance(learn[section], list) or not learn[section]:
+                raise ValueError(f'{section}: must be a non-empty list')
+
+        read = []
+
+        for num, task in enumerate(learn['Read']):
+            if (not isinstance(task, dict) or not isinstance(task.get('text'), str)
+                    or not strings(task.get('answers'))):
+                raise ValueError(f'Read[{num}]: must have a text and answers')
+
+            row_width = task.get('row_width', 3)
+
+            if not isinstance(row_width, int) or row_width < 1:
+                raise ValueError(f'Read[{num}]: row_width must be a positive integer')
+
+            read.append(ReadTask(task['text'], tuple(task['answers']), row_width))
+
+        listen = []
+
+        for num, task in enumerate(learn['Listen']):
+            if (not isinstance(task, dict) or not isinstance(task.get('video'), str)
+                    or not strings(task.get('QA'))):
+                raise ValueError(f'Listen[{num}]: must have a video and QA')
+
+            listen.append(ListenTask(task['video'], tuple(task['QA'])))
+
+        return LearnContent(
+            learn['ExamInfo'],
+            tuple(Word(text) for text in learn['Words']),
+            tuple(read),
+            tuple(listen),
+            tuple(TalkTask(image) for image in learn['Talk']),
+            tuple(WriteTask(text) for text in learn['Write']))
+
+    def load_cache(key: str):
+        """
+        Use this method to load compiled content from the cache
+
+        :param key: Source hash
+        :type key: :obj:`str`
+
+        :return: Returns the compiled content and its digests, None if not cached
+        :rtype: :obj:`typing.Optional[typing.Tuple[LearnContent, typing.Dict[str, str]]]`
+        """
+        try:
+            with open(config.LEARN_CACHE_PATH, 'rb') as cache_file:
+                version, cache_key, learn, digests = pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning('Learn content cache is not loaded: %s', e)
+            return None
+
+        if version != COMPILER_VERSION or cache_key != key:
+            return None
+
+        return learn, digests
+
+    def save_cache(key: str, learn: LearnContent, digests: typing.Dict[str, str]):
+        """
+        Use this method to save compiled content to the cache
+
+        :param key: Source hash
+        :type key: :obj:`str`
+        :param learn: Compiled learn content
+        :type learn: :obj:`LearnContent`
+        :param digests: Content digests by section name
+        :type digests: :obj:`typing.Dict[str, str]`
+        """
+        tmp_path = f'{config.LEARN_CACHE_PATH}.tmp'
+
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                pickle.dump((COMPILER_VERSION, key, learn, digests),
+                            cache_file, pickle.HIGHEST_PROTOCOL)
+
+            os.replace(tmp_path, config.LEARN_CACHE_PATH)
+        except OSError as e:
+            log.warning('Learn content cache is not saved: %s', e)
+
+    def parse(path: str, previous: typing.Optional[LearnContent] = None):
+        """
+        Use this method to load a learn content file
+
+        :param path: Learn content file path
+        :type path: :obj:`str`
+        :param previous: Learn content in use
+        :type previous: :obj:`typing.Optional[LearnContent]`
+
+        :return: Returns the compiled content and its digests by section name
+        :rtype: :obj:`typing.Tuple[LearnContent, typing.Dict[str, str]]`
+
+        :raises ValueError: If the content is not valid
+        """
+        with open(path, 'rb') as learn_file:
+            source = learn_file.read()
+
+        key = hashlib.sha256(source).hexdigest()
+        cached = Content.load_cache(key)
+
+        if cached is not None:
+            learn, digests = cached
+        else:
+            raw = json.loads(source)
+            learn = Content.compile(raw)
+            digests = {
+                section: hashlib.sha1(json.dumps(
+                    raw[section], ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+                for section in SECTIONS}
+
+            Content.save_cache(key, learn, digests)
+
+        if previous is not None:
+            for section in TASK_SECTIONS:
+                if len(learn.tasks(section)) < len(previous.tasks(section)):
+                    raise ValueError(
+                        f'{section}: tasks can only be removed with a restart')
+
+        return learn, digests
+
+    async def reload() -> bool:
+        """
+        Use this method to load the learn content if the file has changed
+
+        :return: Returns True if a new snapshot is in use
+        :rtype: :obj:`bool`
+
+        :raises ValueError: If the first load finds no valid content
+        """
+        loop = asyncio.get_running_loop()
+        previous = Content.current
+
+        try:
+            mtime = await loop.run_in_executor(
+                None, os.path.getmtime, config.LEARN_PATH)
+
+            if mtime == Content.mtime:
+                return False
+
+            Content.mtime = mtime
+            learn, digests = await loop.run_in_executor(
+                None, Content.parse, config.LEARN_PATH,
+                previous.learn if previous is not None else None)
+        except (OSError, ValueError) as e:
+            if previous is None:
+                raise
+
+            log.error('Learn content is not reloaded: %s', e)
+            return False
+
+        # templates and search indexes are built off the event loop
+        if previous is None:
+            sections = SECTIONS
+            templates = await loop.run_in_executor(None, Content.builder, learn)
+        else:
+            sections = [section for section in SECTIONS
+                        if digests[section] != previous.digests[section]]
+
+            if not sections:
+                return False
+
+            templates = await loop.run_in_executor(
+                None, Content.builder, learn, previous.templates, sections)
+
+        Content.current = ContentSnapshot(learn, templates, digests)
+
+        if previous is not None:
+            log.info('Learn content is reloaded: %s', ', '.join(sections))
+
+        return True
+
+    async def watch():
+        """
+        Use this method to reload the learn content every scan interval
+        """
+        while True:
+            await asyncio.sleep(config.CONTENT_SCAN_INTERVAL)
+
+            # a failed reload keeps the current snapshot, the next scan retries
+            try:
+                await Content.reload()
+            except Exception:
+                log.exception('Learn content is not reloaded')
+
+    async def start(builder: typing.Callable):
+        """
+        Use this method to load the learn content and start watching the file
+
+        :param builder: Templates factory, called with the content, the
+            templates in use and the changed section names
+        :type builder: :obj:`typing.Callable`
+        """
+        Content.builder = builder
+        await Content.reload()
+
+        if config.CONTENT_SCAN_INTERVAL and Content.task is None:
+            Content.task = asyncio.get_running_loop().create_task(
+                Content.watch())
+
+    async def stop():
+        """
+        Use this method to stop watching the learn content file
+        """
+        if Content.task is not None:
+            Content.task.cancel()
+            Content.task = None
@@ -1,4 +1,22 @@
 import sqlite3
+import time
+
+import src.config as config
+from src.metrics import DB, Metrics
+from src.pool import ConnectionPool, WriteBuffer
+
+
+pool = ConnectionPool(config.DB_PATH, config.DB_POOL_SIZE, config.DB_SYNCHRONOUS)
+# user answers arriving together are inserted in one transaction
+answers_buffer = WriteBuffer(
+    pool,
+    '''
+    INSERT INTO user_answers(
+        chat_id, message_id, task_type, task_num, answer)
+    VALUES(?, ?, ?, ?, ?)
+    ''',
+    config.ANSWER_BUFFER_DELAY,
+    config.ANSWER_BUFFER_SIZE)
 
 
 class UserAnswersTable:
@@ -6,79 +24,227 @@ class UserAnswersTable:
     Base user answers table class
     """
 
+    @Metrics.timed(DB, 'answers.add')
     async def add(chat_id: int, message_id: int,
                   task_type: str, task_num: int,
                   answer_text: str):
         """
-        Use this method to add user answer
+        Use this method to add user answer. Answers added together are
+        committed in one transaction, the call returns once it is committed.
 
         :param user_id: Unique Telegram user identifier
         :type user_id: :obj:`int``
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
-
         insert_values = [chat_id, message_id,
                          task_type, task_num,
                          answer_text]
 
-        cursor.execute(
-            '''
-            INSERT INTO user_answers(
-                chat_id, message_id, task_type, task_num, answer)
-            VALUES(?, ?, ?, ?, ?)
-            ''',
-            insert_values)
-
-        connect.commit()
+        await answers_buffer.add(insert_values)
 
-    async def get_answer():
+    @Metrics.timed(DB, 'answers.claim')
+    async def claim(admin_id: int, timeout: float = None):
         """
-        Use this method to get user answer
+        Use this method to claim the oldest unclaimed user answer.
+        The answer is leased to the admin and returns to the queue
+        once the lease expires.
+
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        :param timeout: Lease timeout in seconds
+        :type timeout: :obj:`float`
 
         :return: On success, returns answer data
         :rtype: :obj:`typing.Union[None, tuple]`
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
+        answers = await UserAnswersTable.claim_many(admin_id, 1, timeout)
 
-        cursor.execute(
-            '''
-            SELECT ID, chat_id, message_id, task_type, task_num, answer FROM user_answers
-            LIMIT 1
-            ''')
+        if answers:
+            return answers[0]
+
+        return None
 
-        answer = cursor.fetchone()
+    @Metrics.timed(DB, 'answers.claim_many')
+    async def claim_many(admin_id: int, count: int, timeout: float = None):
+        """
+        Use this method to claim a page of the oldest unclaimed user answers
 
-        return answer
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        :param count: Maximum number of answers
+        :type count: :obj:`int`
+        :param timeout: Lease timeout in seconds
+        :type timeout: :obj:`float`
 
-    async def remove(ID: int):
+        :return: Returns a list of answers data
+        :rtype: :obj:`list`
         """
-        Use this method to remove answer
+        if timeout is None:
+            timeout = config.ANSWER_LEASE_TIMEOUT
+
+        def claim_answers(cursor: sqlite3.Cursor):
+            now = time.time()
+
+            # expired leases return to the queue, so unclaimed answers are
+            # one range of the queue index, already in FIFO order
+            cursor.execute(
+                '''
+                UPDATE user_answers
+                SET claimed_by = NULL, claimed_until = 0
+                WHERE claimed_until > 0 AND claimed_until <= ?
+                ''',
+                [now])
+
+            cursor.execute(
+                '''
+                SELECT ID, chat_id, message_id, task_type, task_num, answer FROM user_answers
+                WHERE claimed_until = 0
+                ORDER BY ID
+                LIMIT ?
+                ''',
+                [count])
+
+            answers = cursor.fetchall()
+
+            cursor.executemany(
+                '''
+                UPDATE user_answers
+                SET claimed_by = ?, claimed_until = ?
+                WHERE ID = ?
+                ''',
+                [[admin_id, now + timeout, answer[0]] for answer in answers])
+
+            return answers
+
+        return await pool.transaction(claim_answers)
+
+    @Metrics.timed(DB, 'answers.renew')
+    async def renew(ID: int, admin_id: int, timeout: float = None):
+        """
+        Use this method to extend the lease of a claimed answer
 
         :param ID: Answer ID
-        :type ID: :obj:`int``
+        :type ID: :obj:`int`
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        :param timeout: Lease timeout in seconds
+        :type timeout: :obj:`float`
+
+        :return: Returns True if the admin still held the lease, otherwise False
+        :rtype: :obj:`bool`
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
+        if timeout is None:
+            timeout = config.ANSWER_LEASE_TIMEOUT
 
-        insert_values = [ID]
+        now = time.time()
+        insert_values = [now + timeout, ID, admin_id, now]
 
-        cursor.execute(
+        return await pool.execute(
+            '''
+            UPDATE user_answers
+            SET claimed_until = ?
+            WHERE ID = ? AND claimed_by = ? AND claimed_until > ?
+            ''',
+            insert_values) > 0
+
+    @Metrics.timed(DB, 'answers.release')
+    async def release(ID: int, admin_id: int):
+        """
+        Use this method to return a claimed answer to the queue
+
+        :param ID: Answer ID
+        :type ID: :obj:`int`
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        """
+        insert_values = [ID, admin_id]
+
+        await pool.execute(
+            '''
+            UPDATE user_answers
+            SET claimed_by = NULL, claimed_until = 0
+            WHERE ID = ? AND claimed_by = ?
+            ''',
+            insert_values)
+
+    @Metrics.timed(DB, 'answers.release_many')
+    async def release_many(IDs: list, admin_id: int):
+        """
+        Use this method to return claimed answers to the queue
+
+        :param IDs: Answer IDs
+        :type IDs: :obj:`list`
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        """
+        await pool.executemany(
+            '''
+            UPDATE user_answers
+            SET claimed_by = NULL, claimed_until = 0
+            WHERE ID = ? AND claimed_by = ?
+            ''',
+            [[ID, admin_id] for ID in IDs])
+
+    @Metrics.timed(DB, 'answers.remove')
+    async def remove(ID: int, admin_id: int):
+        """
+        Use this method to remove an answer claimed by the admin
+
+        :param ID: Answer ID
+        :type ID: :obj:`int`
+        :param admin_id: Unique Telegram admin identifier
+        :type admin_id: :obj:`int`
+        """
+        insert_values = [ID, admin_id]
+
+        await pool.execute(
             '''
             DELETE FROM user_answers
-            WHERE ID = ?
+            WHERE ID = ? AND claimed_by = ?
             ''',
             insert_values)
 
-        connect.commit()
+    @Metrics.timed(DB, 'answers.count')
+    async def count():
+        """
+        Use this method to count user answers waiting for review
+
+        :return: Returns the numbers of queued and claimed answers
+        :rtype: :obj:`dict`
+        """
+        row = await pool.fetchone(
+            '''
+            SELECT COUNT(*), COALESCE(SUM(claimed_until > ?), 0) FROM user_answers
+            ''',
+            [time.time()])
+
+        return {'queued': row[0] - row[1], 'claimed': row[1]}
 
 
 class AdminsTable:
     """
     Base admins table class
+
+    Admin user ids are cached in memory, so membership checks
+    do not touch the database.
     """
 
+    cache = None
+    cache_time = 0.0
+
+    @Metrics.timed(DB, 'admins.load')
+    async def load():
+        """
+        Use this method to load admin user ids into the cache
+        """
+        rows = await pool.fetchall(
+            '''
+            SELECT user_id FROM admins
+            ''')
+
+        AdminsTable.cache = {row[0] for row in rows}
+        AdminsTable.cache_time = time.monotonic()
+
+    @Metrics.timed(DB, 'admins.add')
     async def add(user_id: int):
         """
         Use this method to add admin
@@ -86,20 +252,19 @@ class AdminsTable:
         :param user_id: Unique Telegram user identifier
         :type user_id: :obj:`int``
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
-
         insert_values = [user_id]
 
-        cursor.execute(
+        await pool.execute(
             '''
             INSERT INTO admins(user_id)
             VALUES(?)
             ''',
             insert_values)
 
-        connect.commit()
+        if AdminsTable.cache is not None:
+            AdminsTable.cache.add(user_id)
 
+    @Metrics.timed(DB, 'admins.remove')
     async def remove(user_id: int):
         """
         Use this method to remove admin
@@ -107,20 +272,19 @@ class AdminsTable:
         :param user_id: Unique Telegram user identifier
         :type user_id: :obj:`int``
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
-
         insert_values = [user_id]
 
-        cursor.execute(
+        await pool.execute(
             '''
             DELETE FROM admins
             WHERE user_id = ?
             ''',
             insert_values)
 
-        connect.commit()
+        if AdminsTable.cache is not None:
+            AdminsTable.cache.discard(user_id)
 
+    @Metrics.timed(DB, 'admins.exist')
     async def exist(user_id: int):
         """
         Use this method to check user_id
@@ -131,24 +295,13 @@ class AdminsTable:
         :return: On success, returns True
         :rtype: :obj:`bool`
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
+        # rows edited directly in the database are picked up after the TTL
+        if (AdminsTable.cache is None or
+            (config.ADMINS_CACHE_TTL is not None and
+                time.monotonic() - AdminsTable.cache_time > config.ADMINS_CACHE_TTL)):
+            await AdminsTable.load()
 
-        insert_values = [user_id]
-
-        cursor.execute(
-            '''
-            SELECT ID FROM admins
-            WHERE user_id = ?
-            ''',
-            insert_values)
-
-        id = cursor.fetchone()
-
-        if id is not None:
-            return True
-
-        return False
+        return user_id in AdminsTable.cache
 
 
 class Database:
@@ -163,27 +316,68 @@ class Database:
         """
         Use this method to create a database and its tables
         """
-        connect = sqlite3.connect('db/users.db')
-        cursor = connect.cursor()
-
-        cursor.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS
-            admins(
-                ID INTEGER PRIMARY KEY,
-                user_id INTEGER UNIQUE NOT NULL)
-            ''')
-
-        cursor.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS
-            user_answers(
-                ID INTEGER PRIMARY KEY,
-                chat_id INTEGER NOT NULL,
-                message_id INTEGER NOT NULL,
-                task_type TEXT NOT NULL,
-                task_num INTEGER NOT NULL,
-                answer TEXT NOT NULL)
-            ''')
-
-        connect.commit()
+        def create_tables(cursor: sqlite3.Cursor):
+            cursor.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS
+                admins(
+                    ID INTEGER PRIMARY KEY,
+                    user_id INTEGER UNIQUE NOT NULL)
+                ''')
+
+            cursor.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS
+                user_answers(
+                    ID INTEGER PRIMARY KEY,
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    task_type TEXT NOT NULL,
+                    task_num INTEGER NOT NULL,
+                    answer TEXT NOT NULL,
+                    claimed_by INTEGER,
+                    claimed_until REAL NOT NULL DEFAULT 0)
+                ''')
+
+            # databases created before the review queue have no lease columns
+            columns = [column[1] for column in cursor.execute(
+                'PRAGMA table_info(user_answers)')]
+
+            if 'claimed_by' not in columns:
+                cursor.execute(
+                    '''
+                    ALTER TABLE user_answers
+                    ADD COLUMN claimed_by INTEGER
+                    ''')
+
+            if 'claimed_until' not in columns:
+                cursor.execute(
+                    '''
+                    ALTER TABLE user_answers
+                    ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0
+                    ''')
+
+            # answers replied to were kept with an endless lease until the
+            # end of the review, remove those left by unfinished reviews
+            cursor.execute(
+                '''
+                DELETE FROM user_answers
+                WHERE claimed_until = ?
+                ''',
+                [float('inf')])
+
+            cursor.execute(
+                '''
+                CREATE INDEX IF NOT EXISTS
+                user_answers_queue ON user_answers(claimed_until, ID)
+                ''')
+
+        await pool.transaction(create_tables)
+        await AdminsTable.load()
+
+    async def close():
+        """
+        Use this method to write buffered answers and close the database connections
+        """
+        await answers_buffer.flush()
+        await pool.close()
@@ -0,0 +1,130 @@
+import random
+import typing
+from array import array
+
+ROUNDS = 4
+MASK_64 = (1 << 64) - 1
+
+
+class Decks:
+    """
+    Base task decks class
+
+    Every user has a shuffled deck per learn section and is dealt tasks
+    from it without repeats until the deck is exhausted. A deck is packed
+    into one 64-bit array item (32-bit seed, 16-bit cursor, 16-bit deck
+    size), and its permutation is computed from the seed by a small
+    Feistel network, so a draw is O(1) and stores nothing but the cursor.
+    """
+
+    def __init__(self, sections: typing.Iterable[str]) -> None:
+        """
+        :param sections: Learn section names
+        :type sections: :obj:`typing.Iterable[str]`
+        """
+        self.slots = {}
+        self.decks = {section: array('Q') for section in sections}
+
+    def mix(seed: int, round_num: int, value: int) -> int:
+        """
+        Use this method to hash a Feistel half with the seed and the round,
+        by the splitmix64 finalizer, so every seed bit reaches every output bit
+
+        :param seed: Deck seed, 32 bits
+        :type seed: :obj:`int`
+        :param round_num: Round number
+        :type round_num: :obj:`int`
+        :param value: Feistel half, at most 16 bits
+        :type value: :obj:`int`
+
+        :return: Returns a 64-bit hash
+        :rtype: :obj:`int`
+        """
+        mixed = ((seed << 24 | round_num << 16 | value) + 0x9E3779B97F4A7C15) & MASK_64
+        mixed = ((mixed ^ (mixed >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+        mixed = ((mixed ^ (mixed >> 27)) * 0x94D049BB133111EB) & MASK_64
+
+        return mixed ^ (mixed >> 31)
+
+    def permute(num: int, size: int, seed: int) -> int:
+        """
+        Use this method to get the position of a card in a shuffled deck
+
+        :param num: Card number
+        :type num: :obj:`int`
+        :param size: Deck size
+        :type size: :obj:`int`
+        :param seed: Deck seed
+        :type seed: :obj:`int`
+
+        :return: Returns the shuffled card number
+        :rtype: :obj:`int`
+        """
+        half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        mask = (1 << half_bits) - 1
+
+        # cycle walking keeps the permutation inside the deck
+        while True:
+            left, right = num >> half_bits, num & mask
+
+            for round_num in range(ROUNDS):
+                left, right = right, left ^ (Decks.mix(seed, round_num, right) & mask)
+
+            num = (left << half_bits) | right
+
+            if num < size:
+                return num
+
+    def __slot(self, user_id: int) -> int:
+        """
+        Use this method to get the decks slot of a user
+        """
+        slot = self.slots.get(user_id)
+
+        if slot is None:
+            slot = len(self.slots)
+            self.slots[user_id] = slot
+
+            for deck in self.decks.values():
+                deck.append(0)
+
+        return slot
+
+    def draw(self, user_id: int, section: str, size: int, last: int = None) -> int:
+        """
+        Use this method to deal the next task of a user deck
+
+        :param user_id: Unique Telegram user identifier
+        :type user_id: :obj:`int`
+        :param section: Learn section name
+        :type section: :obj:`str`
+        :param size: Number of section tasks, at most 65535
+        :type size: :obj:`int`
+        :param last: Last task number, never dealt twice in a row
+        :type last: :obj:`int`
+
+        :return: Returns a task number
+        :rtype: :obj:`int`
+        """
+        if size < 2:
+            return 0
+
+        deck = self.decks[section]
+        slot = self.__slot(user_id)
+        packed = deck[slot]
+
+        seed = packed >> 32
+        cursor = (packed >> 16) & 0xFFFF
+
+        # the deck is exhausted or the section has changed
+        if cursor >= size or packed & 0xFFFF != size:
+            cursor = 0
+            seed = random.getrandbits(32)
+
+            while Decks.permute(0, size, seed) == last:
+                seed = random.getrandbits(32)
+
+        task = Decks.permute(cursor, size, seed)
+        deck[slot] = (seed << 32) | ((cursor + 1) << 16) | size
+
+        return task
@@ -1,14 +1,157 @@
-from random import randint, shuffle
+import typing
+from random import shuffle
 
-from aiogram import types
 from aiogram.dispatcher.storage import FSMContext
 from aiogram.types.inline_keyboard import (InlineKeyboardButton,
                                            InlineKeyboardMarkup)
+from aiogram.utils.markdown import quote_html
 
+import src.callbacks as callbacks
 import src.config as config
-from src.config import bot
+from src.callbacks import CallbackData
+from src.config import bot, dp
+from src.content import SECTIONS, Content, LearnContent
 from src.database import Database
+from src.decks import Decks
 from src.tgfiles import TGFile
+from src.words import WordIndex, WordPages
+
+# Telegram limit of results in one inline query answer
+INLINE_PAGE_SIZE = 50
+
+# shuffled task decks of every user
+decks = Decks(('Read', 'Listen', 'Talk', 'Write'))
+
+
+class LearnTemplates:
+    """
+    Base learn templates class
+
+    Keyboards and texts are built once per learn content snapshot.
+    They are shared between updates and must not be modified.
+    """
+
+    menu = InlineKeyboardMarkup(row_width=2).add(
+        InlineKeyboardButton(
+            text='Sprechen',
+            callback_data=CallbackData.pack(callbacks.MENU_TALK)),
+        InlineKeyboardButton(
+            text='Schreiben',
+            callback_data=CallbackData.pack(callbacks.MENU_WRITE)),
+        InlineKeyboardButton(
+            text='Hören',
+            callback_data=CallbackData.pack(callbacks.MENU_LISTEN)),
+        InlineKeyboardButton(
+            text='Lesen',
+            callback_data=CallbackData.pack(callbacks.MENU_READ)))
+
+    def __init__(self, learn: LearnContent, previous: 'LearnTemplates' = None,
+                 sections: typing.Iterable[str] = SECTIONS) -> None:
+        """
+        :param learn: Compiled learn content
+        :type learn: :obj:`LearnContent`
+        :param previous: Templates of the previous content, reused for unchanged sections
+        :type previous: :obj:`LearnTemplates`
+        :param sections: Changed learn section names
+        :type sections: :obj:`typing.Iterable[str]`
+        """
+        markup = LearnTemplates.markup
+        pack = CallbackData.pack
+
+        if previous is not None:
+            vars(self).update(vars(previous))
+
+        if 'Read' in sections:
+            tasks = learn.read
+
+            self.read_answers = [
+                tuple(InlineKeyboardButton(
+                    text=answer,
+                    callback_data=pack(callbacks.READ_RESULT, num, a_num == 0))
+                    for a_num, answer in enumerate(task.answers))
+                for num, task in enumerate(tasks)]
+            self.read_row_width = [
+                task.row_width for task in tasks]
+            self.read_wrong = [
+                f'Неправильно. 😔 \nПравильный ответ был: <b>«{task.answers[0]}»</b>.'
+                for task in tasks]
+            self.read_continue = [
+                markup('Продолжить »', pack(callbacks.READ_NEXT, num))
+                for num in range(len(tasks))]
+
+        if 'Listen' in sections:
+            tasks = learn.listen
+
+            self.listen_answers = [
+                markup('Посмотреть ответы', pack(callbacks.LISTEN_ANSWERS, num))
+                for num in range(len(tasks))]
+            self.listen_qa = [
+                ''.join(f'{qa}\n' for qa in task.qa) for task in tasks]
+            self.listen_continue = [
+                markup('Продолжить »', pack(callbacks.LISTEN_NEXT, num))
+                for num in range(len(tasks))]
+
+        if 'Talk' in sections:
+            count = len(learn.talk)
+
+            self.talk_answer = [
+                markup('Написать ответ', pack(callbacks.TALK_ANSWER, num))
+                for num in range(count)]
+            self.talk_continue = [
+                markup('Продолжить »', pack(callbacks.TALK_NEXT, num))
+                for num in range(count)]
+
+        if 'Write' in sections:
+            count = len(learn.write)
+
+            self.write_answer = [
+                markup('Написать ответ', pack(callbacks.WRITE_ANSWER, num))
+                for num in range(count)]
+            self.write_continue = [
+                markup('Продолжить »', pack(callbacks.WRITE_NEXT, num))
+                for num in range(count)]
+
+        if 'Words' in sections:
+            self.word_list = tuple(word.text for word in learn.words)
+            self.words = {
+                count: WordPages(self.word_list, count)
+                for count in config.WORDS_PAGE_SIZES}
+            self.word_index = WordIndex(
+                learn.words, config.WORDS_SEARCH_LIMIT, config.WORDS_SEARCH_CACHE_SIZE)
+
+    def markup(text: str, callback_data: str):
+        """
+        Use this method to build a keyboard with one button
+
+        :param text: Button text
+        :type text: :obj:`str`
+        :param callback_data: Button callback data
+        :type callback_data: :obj:`str`
+
+        :return: Returns the keyboard
+        :rtype: :obj:`InlineKeyboardMarkup`
+        """
+        return InlineKeyboardMarkup().add(
+            InlineKeyboardButton(text=text, callback_data=callback_data))
+
+    def word_pages(self, count: int):
+        """
+        Use this method to get rendered words pages, pages of sizes
+        missing from WORDS_PAGE_SIZES are rendered on first use
+
+        :param count: Maximum number of words per page
+        :type count: :obj:`int`
+
+        :return: Returns the words pages
+        :rtype: :obj:`WordPages`
+        """
+        pages = self.words.get(count)
+
+        if pages is None:
+            pages = WordPages(self.word_list, count)
+            self.words[count] = pages
+
+        return pages
 
 
 class Learn:
@@ -31,13 +174,15 @@ class Learn:
         :return: On success, returns a sent or edited message
         :rtype: :obj:`types.Message`
         """
+        content = Content.current
+
         if message_id:
             return await bot.edit_message_text(
-                config.LEARN['ExamInfo'],
+                content.learn.exam_info,
                 chat_id, message_id,)
 
         return await bot.send_message(
-            chat_id, config.LEARN['ExamInfo'])
+            chat_id, content.learn.exam_info)
 
     async def words(self, chat_id: int, page: int = 0, message_id: int = None, count: int = 10):
         """
@@ -55,33 +200,14 @@ class Learn:
         :return: On success, returns a sent or edited message
         :rtype: :obj:`types.Message`
         """
-        if page * count > len(config.LEARN['Words']):
-            return
-
-        inline_keyboard = InlineKeyboardMarkup()
-        fst_word = page * count
-        until_word = min((page + 1) * count, len(config.LEARN['Words']))
-        buttons = []
+        content = Content.current
 
-        page_words = config.LEARN['Words'][fst_word:until_word]
-        msg_text = f'<b>Страница {page + 1}</b>\n'
+        words_page = content.templates.word_pages(count).get(page)
 
-        for word in page_words:
-            msg_text += f'\n{word}'
-
-        if fst_word != 0:
-            buttons.append(
-                InlineKeyboardButton(
-                    text='« Назад',
-                    callback_data=f'words_{page - 1}'))
-
-        if until_word < len(config.LEARN['Words']):
-            buttons.append(
-                InlineKeyboardButton(
-                    text='Далее »',
-                    callback_data=f'words_{page + 1}'))
+        if words_page is None:
+            return
 
-        inline_keyboard.add(*buttons)
+        msg_text, inline_keyboard = words_page
 
         if message_id:
             return await bot.edit_message_text(
@@ -94,28 +220,60 @@ class Learn:
             parse_mode='html',
             reply_markup=inline_keyboard)
 
+    async def search_words(self, chat_id: int, query: str, count: int = 10):
+        """
+        Use this method to send the words closest to a query, which may be misspelled
 
-class LearnMenu:
-    """
-    Base menu class
-    """
+        :param chat_id: Chat ID
+        :type chat_id: :obj:`int`
+        :param query: Search query
+        :type query: :obj:`str`
+        :param count: Maximum number of words
+        :type count: :obj:`int`
 
-    def __init__(self) -> None:
-        self.__button_talk = InlineKeyboardButton(
-            text='Sprechen',
-            callback_data='menu_main_talk')
+        :return: On success, returns a sent message
+        :rtype: :obj:`types.Message`
+        """
+        content = Content.current
 
-        self.__button_write = InlineKeyboardButton(
-            text='Schreiben',
-            callback_data='menu_main_write')
+        words = content.templates.word_index.closest(query, count)
+        msg_text = WordPages.text(
+            f'Поиск: {quote_html(query[:64])}',
+            [word.text for word in words] or ['Ничего не найдено'])
 
-        self.__button_listen = InlineKeyboardButton(
-            text='Hören',
-            callback_data='menu_main_listen')
+        return await bot.send_message(
+            chat_id, msg_text,
+            parse_mode='html')
 
-        self.__button_read = InlineKeyboardButton(
-            text='Lesen',
-            callback_data='menu_main_read')
+    async def inline_words(self, inline_query_id: str, query: str, offset: str = ''):
+        """
+        Use this method to answer an inline query with matching words
+
+        :param inline_query_id: Inline query ID
+        :type inline_query_id: :obj:`str`
+        :param query: Search query
+        :type query: :obj:`str`
+        :param offset: Offset of the results page
+        :type offset: :obj:`str`
+
+        :return: On success, returns True
+        :rtype: :obj:`bool`
+        """
+        content = Content.current
+
+        # results are cached rendered, a JSON string is sent as is
+        results, next_offset = content.templates.word_index.inline(
+            query, int(offset) if offset.isdigit() else 0, INLINE_PAGE_SIZE)
+
+        return await bot.answer_inline_query(
+            inline_query_id, results,
+            next_offset=next_offset)
+
+
+class LearnMenu:
+    """
+    Base menu class
+    """
 
     async def send(self, chat_id: int):
         """
@@ -127,37 +285,10 @@ class LearnMenu:
         :return: On success, returns a sent message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup(row_width=2)
-
-        inline_keyboard.add(
-            self.__button_talk,
-            self.__button_write,
-            self.__button_listen,
-            self.__button_read)
-
         return await bot.send_message(
             chat_id=chat_id,
             text='Подготовка к экзамену по немецкому (часть А1)',
-            reply_markup=inline_keyboard)
-
-    async def __get_random_except(self, max_num: int, except_num: int):
-        """
-        Use this method to get a random value, except for one value
-
-        :param max_num: Maximum value
-        :type max_num: :obj:`int`
-        :param except_num: Except value
-        :type except_num: :obj:`int`
-
-        :return: Returns a random value, except for one value
-        :rtype: :obj:`int`
-        """
-        rand = randint(0, max_num)
-
-        while rand == except_num:
-            rand = randint(0, max_num)
-
-        return rand
+            reply_markup=LearnTemplates.menu)
 
     async def read_task(self, chat_id: int, message_id: int = None, task: int = None):
         """
@@ -173,31 +304,17 @@ class LearnMenu:
         :return: On success, returns a sent or edited message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
-        new_task: int
-
-        if task is not None:
-            new_task = await self.__get_random_except(
-                len(config.LEARN['Read']) - 1, task)
-        else:
-            new_task = randint(0, len(config.LEARN['Read']) - 1)
+        content = Content.current
 
-        task_text = config.LEARN['Read'][new_task]['text']
-        task_answers = [
-            InlineKeyboardButton(
-                text=config.LEARN['Read'][new_task]['answers'][0],
-                callback_data=f'read_{new_task}_correct')]
+        new_task = decks.draw(
+            chat_id, 'Read', len(content.learn.read), task)
 
-        if 'row_width' in config.LEARN['Read'][new_task]:
-            inline_keyboard.row_width = config.LEARN['Read'][new_task]['row_width']
-
-        for a_num in range(1, len(config.LEARN['Read'][new_task]['answers'])):
-            task_answers.append(
-                InlineKeyboardButton(
-                    text=config.LEARN['Read'][new_task]['answers'][a_num],
-                    callback_data=f'read_{new_task}_wrong'))
+        task_text = content.learn.read[new_task].text
+        task_answers = list(content.templates.read_answers[new_task])
 
         shuffle(task_answers)
+        inline_keyboard = InlineKeyboardMarkup(
+            row_width=content.templates.read_row_width[new_task])
         inline_keyboard.add(*task_answers)
 
         if message_id:
@@ -226,18 +343,15 @@ class LearnMenu:
         :return: On success, returns a sent or edited message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
+        content = Content.current
+
+        inline_keyboard = content.templates.read_continue[task]
         result_text: str
 
         if answer:
             result_text = f'Правильно! 🥳'
         else:
-            result_text = f'Неправильно. 😔 \nПравильный ответ был: <b>«{config.LEARN["Read"][task]["answers"][0]}»</b>.'
-
-        inline_keyboard.add(
-            InlineKeyboardButton(
-                text='Продолжить »',
-                callback_data=f'read_{task}'))
+            result_text = content.templates.read_wrong[task]
 
         if message_id:
             return await bot.edit_message_text(
@@ -264,39 +378,22 @@ class LearnMenu:
         :return: On success, returns a message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
-        new_task: int
+        content = Content.current
 
         await bot.edit_message_reply_markup(
             chat_id, message_id)
 
-        if task is not None:
-            new_task = await self.__get_random_except(
-                len(config.LEARN['Listen']) - 1, task)
-        else:
-            new_task = randint(0, len(config.LEARN['Listen']) - 1)
+        new_task = decks.draw(
+            chat_id, 'Listen', len(content.learn.listen), task)
 
-        inline_keyboard.add(
-            InlineKeyboardButton(
-                text='Посмотреть ответы',
-                callback_data=f'listen_answers_{new_task}'))
+        inline_keyboard = content.templates.listen_answers[new_task]
 
-        if await TGFile.exist.vid(config.LEARN['Listen'][new_task]['video']):
-            await bot.send_video(
-                chat_id=chat_id,
-                video=await TGFile.get.file_id(
-                    config.LEARN['Listen'][new_task]['video']),
-                reply_markup=inline_keyboard)
-        else:
-            send_msg = await bot.send_video(
+        await TGFile.send.vid(
+            content.learn.listen[new_task].video,
+            lambda video: bot.send_video(
                 chat_id=chat_id,
-                video=types.InputFile(
-                    f'data/vid/{config.LEARN["Listen"][new_task]["video"]}'),
-                reply_markup=inline_keyboard)
-
-            await TGFile.add.vid(
-                config.LEARN['Listen'][new_task]['video'],
-                send_msg.video.file_id)
+                video=video,
+                reply_markup=inline_keyboard))
 
     async def listen_answers(self, chat_id: int, message_id: int, task: int):
         """
@@ -312,21 +409,12 @@ class LearnMenu:
         :return: On success, returns edited message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
-        answers = ''
-
-        inline_keyboard.add(
-            InlineKeyboardButton(
-                text='Продолжить »',
-                callback_data=f'listen_{task}'))
-
-        for qa in config.LEARN['Listen'][task]['QA']:
-            answers += f'{qa}\n'
+        content = Content.current
 
         await bot.edit_message_caption(
             chat_id, message_id,
-            caption=answers,
-            reply_markup=inline_keyboard)
+            caption=content.templates.listen_qa[task],
+            reply_markup=content.templates.listen_continue[task])
 
     async def talk_task(self, chat_id: int, message_id, task: int = None):
         """
@@ -342,41 +430,25 @@ class LearnMenu:
         :return: On success, returns a sent message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
-        new_task: int
+        content = Content.current
 
         await bot.edit_message_reply_markup(
             chat_id, message_id)
 
-        if task is not None:
-            new_task = await self.__get_random_except(
-                len(config.LEARN['Talk']) - 1, task)
-        else:
-            new_task = randint(0, len(config.LEARN['Talk']) - 1)
+        new_task = decks.draw(
+            chat_id, 'Talk', len(content.learn.talk), task)
 
-        config.ANSWERS[chat_id] = new_task
+        await dp.current_state(chat=chat_id, user=chat_id).update_data(
+            task=new_task)
 
-        inline_keyboard.add(
-            InlineKeyboardButton(
-                text='Написать ответ',
-                callback_data=f'talk_answer_{new_task}'))
+        inline_keyboard = content.templates.talk_answer[new_task]
 
-        if await TGFile.exist.img(config.LEARN['Talk'][new_task]):
-            await bot.send_photo(
-                chat_id=chat_id,
-                photo=await TGFile.get.file_id(
-                    config.LEARN['Talk'][new_task]),
-                reply_markup=inline_keyboard)
-        else:
-            send_msg = await bot.send_photo(
+        await TGFile.send.img(
+            content.learn.talk[new_task].image,
+            lambda photo: bot.send_photo(
                 chat_id=chat_id,
-                photo=types.InputFile(
-                    f'data/img/{config.LEARN["Talk"][new_task]}'),
-                reply_markup=inline_keyboard)
-
-            await TGFile.add.img(
-                config.LEARN['Talk'][new_task],
-                send_msg.photo[-1].file_id)
+                photo=photo,
+                reply_markup=inline_keyboard))
 
     async def talk_answer_start(self, chat_id: int, message_id: int):
         """
@@ -410,25 +482,19 @@ class LearnMenu:
         :return: On success, returns a sent message
         :rtype: :obj:`types.Message`
         """
-        await state.finish()
+        content = Content.current
 
-        inline_keyboard = InlineKeyboardMarkup()
+        data = await state.get_data()
+        await state.finish()
 
-        if chat_id in config.ANSWERS:
+        if 'task' in data:
             await Database.answers.add(
                 chat_id, message_id, 'talk',
-                config.ANSWERS[chat_id], answer)
-
-            inline_keyboard.add(
-                InlineKeyboardButton(
-                    text='Продолжить »',
-                    callback_data=f'talk_{config.ANSWERS[chat_id]}'))
-
-            del config.ANSWERS[chat_id]
+                data['task'], answer)
 
             return await bot.send_message(
                 chat_id, 'Отлично! Твой ответ передан на проверку.',
-                reply_markup=inline_keyboard)
+                reply_markup=content.templates.talk_continue[data['task']])
 
         return await bot.send_message(
             chat_id, text='Похоже что-то пошло не так. 😔')
@@ -447,28 +513,22 @@ class LearnMenu:
         :return: On success, returns a sent message
         :rtype: :obj:`types.Message`
         """
-        inline_keyboard = InlineKeyboardMarkup()
-        new_task: int
+        content = Content.current
 
         await bot.edit_message_reply_markup(
             chat_id, message_id)
 
-        if task is not None:
-            new_task = await self.__get_random_except(
-                len(config.LEARN['Write']) - 1, task)
-        else:
-            new_task = randint(0, len(config.LEARN['Write']) - 1)
+        new_task = decks.draw(
+            chat_id, 'Write', len(content.learn.write), task)
 
-        config.ANSWERS[chat_id] = new_task
+        await dp.current_state(chat=chat_id, user=chat_id).update_data(
+            task=new_task)
 
-        inline_keyboard.add(
-            InlineKeyboardButton(
-                text='Написать ответ',
-                callback_data=f'write_answer_{new_task}'))
+        inline_keyboard = content.templates.write_answer[new_task]
 
         await bot.send_message(
             chat_id=chat_id,
-            text=config.LEARN['Write'][new_task],
+            text=content.learn.write[new_task].text,
             reply_markup=inline_keyboard)
 
     async def write_answer_start(self, chat_id: int, message_id: int):
@@ -506,25 +566,19 @@ class LearnMenu:
         :return: On success, returns a sent or edited message
         :rtype: :obj:`typing.Union[types.Message]`
         """
-        await state.finish()
+        content = Content.current
 
-        inline_keyboard = InlineKeyboardMarkup()
+        data = await state.get_data()
+        await state.finish()
 
-        if chat_id in config.ANSWERS:
+        if 'task' in data:
             await Database.answers.add(
                 chat_id, message_id, 'write',
-                config.ANSWERS[chat_id], answer)
-
-            inline_keyboard.add(
-                InlineKeyboardButton(
-                    text='Продолжить »',
-                    callback_data=f'write_{config.ANSWERS[chat_id]}'))
-
-            del config.ANSWERS[chat_id]
+                data['task'], answer)
 
             return await bot.send_message(
                 chat_id, 'Отлично! Твой ответ передан на проверку.',
-                reply_markup=inline_keyboard)
+                reply_markup=content.templates.write_continue[data['task']])
 
         return await bot.send_message(
             chat_id, text='Похоже что-то пошло не так. 😔')
@@ -0,0 +1,220 @@
+import functools
+import inspect
+import logging
+import time
+import typing
+from bisect import bisect_left
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HANDLER = 'bot_handler_seconds'
+API = 'bot_api_request_seconds'
+DB = 'bot_db_query_seconds'
+ACK = 'bot_callback_ack_seconds'
+SEND_QUEUE = 'bot_send_queue_seconds'
+
+# histogram name -> (help, label name)
+HISTOGRAMS = {
+    HANDLER: ('Update handler latency', 'handler'),
+    API: ('Bot API request latency', 'method'),
+    DB: ('Database query latency', 'query'),
+    ACK: ('Callback query answer latency from arrival', 'result'),
+    SEND_QUEUE: ('Bot API send wait for the scheduler', 'priority'),
+}
+
+
+class Histogram:
+    """
+    Base latency histogram class
+    """
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        Use this method to record a value
+
+        :param value: Value in seconds
+        :type value: :obj:`float`
+        """
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Base metrics class
+
+    Latencies are kept in fixed-bucket histograms, recording one costs a
+    bisect and three additions. Gauges are collected when the endpoint
+    is scraped. Metrics are served in the Prometheus text format.
+    """
+
+    histograms = {name: {} for name in HISTOGRAMS}
+    errors = {}
+    gauges = []
+    runner = None
+
+    def observe(name: str, label: str, seconds: float):
+        """
+        Use this method to record a latency
+
+        :param name: Histogram name
+        :type name: :obj:`str`
+        :param label: Label value
+        :type label: :obj:`str`
+        :param seconds: Latency in seconds
+        :type seconds: :obj:`float`
+        """
+        histogram = Metrics.histograms[name].get(label)
+
+        if histogram is None:
+            histogram = Histogram()
+            Metrics.histograms[name][label] = histogram
+
+        histogram.observe(seconds)
+
+    def error(method: str):
+        """
+        Use this method to count a failed Bot API request
+
+        :param method: API method name
+        :type method: :obj:`str`
+        """
+        Metrics.errors[method] = Metrics.errors.get(method, 0) + 1
+
+    def timed(name: str, label: str):
+        """
+        Use this method to record the latency of a coroutine function
+
+        :param name: Histogram name
+        :type name: :obj:`str`
+        :param label: Label value
+        :type label: :obj:`str`
+
+        :return: Returns a decorator
+        :rtype: :obj:`typing.Callable`
+        """
+        def decorator(func: typing.Callable):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    Metrics.observe(name, label, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def gauge(name: str, help_text: str, collect: typing.Callable, label: str = None):
+        """
+        Use this method to register a gauge
+
+        :param name: Gauge name
+        :type name: :obj:`str`
+        :param help_text: Gauge description
+        :type help_text: :obj:`str`
+        :param collect: Function or coroutine function returning the value,
+            or a dict of values by label value if the label is set
+        :type collect: :obj:`typing.Callable`
+        :param label: Label name
+        :type label: :obj:`str`
+        """
+        Metrics.gauges.append((name, help_text, collect, label))
+
+    async def render() -> str:
+        """
+        Use this method to render all metrics in the Prometheus text format
+
+        :return: Returns the metrics text
+        :rtype: :obj:`str`
+        """
+        lines = []
+
+        for name, (help_text, label) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+
+            for value, histogram in list(Metrics.histograms[name].items()):
+                cumulative = 0
+
+                for bound, count in zip((*BUCKETS, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+
+                lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.total}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+
+        lines.append('# HELP bot_api_errors_total Failed Bot API requests')
+        lines.append('# TYPE bot_api_errors_total counter')
+
+        for method, count in list(Metrics.errors.items()):
+            lines.append(f'bot_api_errors_total{{method="{method}"}} {count}')
+
+        for name, help_text, collect, label in Metrics.gauges:
+            try:
+                value = collect()
+
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                log.warning('Gauge %s is not collected: %s', name, e)
+                continue
+
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+
+            if label is None:
+                lines.append(f'{name} {value}')
+            else:
+                for label_value, sample in value.items():
+                    lines.append(f'{name}{{{label}="{label_value}"}} {sample}')
+
+        return '\n'.join(lines) + '\n'
+
+    async def handle(request: web.Request):
+        return web.Response(
+            text=await Metrics.render(),
+            content_type='text/plain',
+            charset='utf-8')
+
+    async def start(host: str, port: int):
+        """
+        Use this method to serve metrics on /metrics
+
+        :param host: Host to listen on
+        :type host: :obj:`str`
+        :param port: Port to listen on
+        :type port: :obj:`int`
+        """
+        if Metrics.runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', Metrics.handle)
+
+        Metrics.runner = web.AppRunner(app, access_log=None)
+        await Metrics.runner.setup()
+        await web.TCPSite(Metrics.runner, host, port).start()
+
+    async def stop():
+        """
+        Use this method to stop serving metrics
+        """
+        if Metrics.runner is not None:
+            await Metrics.runner.cleanup()
+            Metrics.runner = None
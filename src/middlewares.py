@@ -0,0 +1,327 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import typing
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from src.metrics import ACK, HANDLER, Metrics
+
+log = logging.getLogger(__name__)
+
+# keys of personal names in users and chats, replaced when recording
+NAME_KEYS = ('first_name', 'last_name', 'username', 'title')
+# keys of user and chat IDs, replaced with pseudonyms when recording
+ID_KEYS = ('id', 'user_id', 'chat_id')
+
+
+def get_chat_id(update: types.Update) -> typing.Optional[int]:
+    """
+    Use this method to get the chat of an update
+
+    :param update: Update
+    :type update: :obj:`types.Update`
+
+    :return: Returns the chat ID, None for updates without a chat
+    :rtype: :obj:`typing.Optional[int]`
+    """
+    message = update.message or update.edited_message
+
+    if message is not None:
+        return message.chat.id
+
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+
+        return update.callback_query.from_user.id
+
+    return None
+
+
+class ChatLockMiddleware(BaseMiddleware):
+    """
+    Chat lock middleware
+
+    Updates of one chat are processed one at a time, updates of
+    different chats in parallel. A callback repeated while the same
+    callback is in progress is dropped. Set it up after middlewares
+    that may cancel an update.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        # chat ID -> [lock, number of updates holding or waiting for it]
+        self.locks = {}
+        self.callbacks = set()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        chat_id = get_chat_id(update)
+
+        if chat_id is None:
+            return
+
+        call = update.callback_query
+
+        if call is not None:
+            key = (chat_id,
+                   call.message.message_id if call.message else call.inline_message_id,
+                   call.data)
+
+            if key in self.callbacks:
+                raise CancelHandler()
+
+            self.callbacks.add(key)
+            data['callback_key'] = key
+
+        entry = self.locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self.__release(chat_id, data, False)
+            raise
+
+        data['chat_lock'] = chat_id
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        if 'chat_lock' in data:
+            self.__release(data['chat_lock'], data, True)
+
+    def __release(self, chat_id: int, data: dict, locked: bool):
+        """
+        Use this method to release the chat lock and the callback
+        """
+        entry = self.locks[chat_id]
+        entry[1] -= 1
+
+        if locked:
+            entry[0].release()
+
+        if not entry[1]:
+            del self.locks[chat_id]
+
+        self.callbacks.discard(data.get('callback_key'))
+
+
+class CallbackAckMiddleware(BaseMiddleware):
+    """
+    Callback acknowledgement middleware
+
+    Every callback query is answered as soon as it arrives, concurrently
+    with its handler, so clients stop the button spinner at once. Set it
+    up before middlewares that may cancel or hold back an update.
+    Latency from arrival to the answer is recorded in a histogram.
+    """
+
+    def __init__(self, toast: typing.Optional[typing.Callable] = None) -> None:
+        """
+        :param toast: Returns the notification text for a callback query, or None
+        :type toast: :obj:`typing.Optional[typing.Callable]`
+        """
+        super().__init__()
+
+        self.toast = toast
+        self.tasks = set()
+
+    async def __ack(self, call: types.CallbackQuery, start: float):
+        """
+        Use this method to answer a callback query
+        """
+        text = self.toast(call) if self.toast is not None else None
+        result = 'answered'
+
+        try:
+            await call.bot.answer_callback_query(call.id, text=text)
+        except Exception as e:
+            log.warning('Callback query is not answered: %s', e)
+            result = 'failed'
+
+        Metrics.observe(ACK, result, time.perf_counter() - start)
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if update.callback_query is None:
+            return
+
+        task = asyncio.get_running_loop().create_task(
+            self.__ack(update.callback_query, time.perf_counter()))
+
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Handler metrics middleware
+
+    Records the latency of every message, callback and inline query handler.
+    Callback queries dispatched by a router are recorded by route handler.
+    """
+
+    def __init__(self, router=None) -> None:
+        """
+        :param router: Callback router
+        :type router: :obj:`typing.Optional[CallbackRouter]`
+        """
+        super().__init__()
+
+        self.router = router
+
+    def __observe(self, data: dict):
+        """
+        Use this method to record the latency of the handler that has run
+        """
+        if 'metrics_handler' in data:
+            name, start = data['metrics_handler']
+            Metrics.observe(HANDLER, name, time.perf_counter() - start)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        data['metrics_handler'] = (current_handler.get().__name__, time.perf_counter())
+
+    async def on_process_callback_query(self, call: types.CallbackQuery, data: dict):
+        handler = current_handler.get()
+
+        if self.router is not None:
+            resolved = self.router.resolve(call)
+
+            if resolved is not None:
+                handler = resolved[0]
+
+        data['metrics_handler'] = (handler.__name__, time.perf_counter())
+
+    async def on_process_inline_query(self, inline_query: types.InlineQuery, data: dict):
+        data['metrics_handler'] = (current_handler.get().__name__, time.perf_counter())
+
+    async def on_post_process_message(self, message: types.Message, results: list, data: dict):
+        self.__observe(data)
+
+    async def on_post_process_callback_query(self, call: types.CallbackQuery, results: list, data: dict):
+        self.__observe(data)
+
+    async def on_post_process_inline_query(self, inline_query: types.InlineQuery, results: list, data: dict):
+        self.__observe(data)
+
+
+def anonymise(value, salt: bytes):
+    """
+    Use this method to replace user and chat IDs and names in update data
+
+    IDs are replaced with keyed hashes, so one user keeps one pseudonym
+    for the salt and the sign of group chat IDs is kept.
+
+    :param value: Update data, as returned by to_python
+    :type value: :obj:`typing.Any`
+    :param salt: Hash key
+    :type salt: :obj:`bytes`
+
+    :return: Returns anonymised data
+    :rtype: :obj:`typing.Any`
+    """
+    if isinstance(value, list):
+        return [anonymise(item, salt) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    result = {}
+
+    for key, item in value.items():
+        if key in ID_KEYS and isinstance(item, int) and not isinstance(item, bool):
+            digest = hmac.new(salt, str(abs(item)).encode(), hashlib.sha256).digest()
+            pseudonym = int.from_bytes(digest[:5], 'big') + 1
+            result[key] = -pseudonym if item < 0 else pseudonym
+        elif key in NAME_KEYS and isinstance(item, str):
+            result[key] = 'User'
+        elif key == 'chat_instance':
+            result[key] = hmac.new(salt, item.encode(), hashlib.sha256).hexdigest()[:16]
+        else:
+            result[key] = anonymise(item, salt)
+
+    return result
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Update recorder middleware
+
+    Every incoming update is anonymised and appended to a gzip file as
+    one JSON line with its arrival time, for replay by benchmarks.replay.
+    Lines are collected in memory and written off the event loop every
+    flush delay. Set it up first to record updates other middlewares
+    cancel.
+    """
+
+    def __init__(self, path: str, salt: typing.Optional[str] = None, delay: float = 1.0) -> None:
+        """
+        :param path: Log file path
+        :type path: :obj:`str`
+        :param salt: Key of ID pseudonyms, random for every run if not set
+        :type salt: :obj:`typing.Optional[str]`
+        :param delay: Seconds to collect lines before a write
+        :type delay: :obj:`float`
+        """
+        super().__init__()
+
+        self.path = path
+        self.salt = salt.encode() if salt is not None else os.urandom(32)
+        self.delay = delay
+        self.lines = []
+        self.task = None
+        self.lock = asyncio.Lock()
+
+    def write(self, lines: typing.List[str]):
+        """
+        Use this method to append lines to the log, as a new gzip member
+        """
+        with gzip.open(self.path, 'at', encoding='utf-8') as log_file:
+            log_file.writelines(lines)
+
+    async def flush_later(self):
+        """
+        Use this method to flush lines after the flush delay
+        """
+        await asyncio.sleep(self.delay)
+
+        self.task = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Use this method to write collected lines to the log
+        """
+        async with self.lock:
+            if not self.lines:
+                return
+
+            lines, self.lines = self.lines, []
+
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, lines)
+            except OSError as e:
+                log.error('Updates are not recorded: %s', e)
+
+    async def close(self):
+        """
+        Use this method to cancel the scheduled flush and flush immediately
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        await self.flush()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        record = {'time': round(time.time(), 3), 'update': anonymise(update.to_python(), self.salt)}
+        self.lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.flush_later())
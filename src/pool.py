@@ -0,0 +1,315 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConnectionPool:
+    """
+    Base SQLite connection pool class
+
+    Every executor thread owns one long-lived connection, so queries
+    never block the event loop. Statements are compiled once per
+    connection and reused from the sqlite3 statement cache.
+    """
+
+    def __init__(self, path: str, size: int = 1, synchronous: str = 'NORMAL') -> None:
+        """
+        :param path: Database file path
+        :type path: :obj:`str`
+        :param size: Number of connections (executor threads)
+        :type size: :obj:`int`
+        :param synchronous: SQLite synchronous mode, FULL syncs every commit to disk
+        :type synchronous: :obj:`str`
+        """
+        self.path = path
+        self.size = size
+        self.synchronous = synchronous
+
+        self.__executor = None
+        self.__local = threading.local()
+        self.__connections = []
+        self.__lock = threading.Lock()
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Use this method to get the connection of the current executor thread
+
+        :return: Returns the thread connection
+        :rtype: :obj:`sqlite3.Connection`
+        """
+        connect = getattr(self.__local, 'connect', None)
+
+        if connect is None:
+            connect = sqlite3.connect(
+                self.path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=128)
+
+            connect.execute('PRAGMA journal_mode = WAL')
+            connect.execute(f'PRAGMA synchronous = {self.synchronous}')
+            connect.execute('PRAGMA busy_timeout = 5000')
+
+            self.__local.connect = connect
+
+            with self.__lock:
+                self.__connections.append(connect)
+
+        return connect
+
+    def __transaction(self, func, args: tuple):
+        """
+        Use this method to run a function inside a write transaction
+
+        :param func: Function called with a cursor and args
+        :type func: :obj:`typing.Callable`
+        :param args: Function arguments
+        :type args: :obj:`tuple`
+
+        :return: Returns the function result
+        :rtype: :obj:`typing.Any`
+        """
+        connect = self.__connect()
+        cursor = connect.cursor()
+
+        cursor.execute('BEGIN IMMEDIATE')
+
+        try:
+            result = func(cursor, *args)
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+
+        cursor.execute('COMMIT')
+
+        return result
+
+    def __query(self, sql: str, parameters, size: int):
+        """
+        Use this method to run a read query
+
+        :param sql: SQL query
+        :type sql: :obj:`str`
+        :param parameters: Query parameters
+        :type parameters: :obj:`typing.Sequence`
+        :param size: Number of rows to fetch, 0 fetches all rows
+        :type size: :obj:`int`
+
+        :return: Returns a row or a list of rows
+        :rtype: :obj:`typing.Union[None, tuple, list]`
+        """
+        cursor = self.__connect().execute(sql, parameters)
+
+        if size == 1:
+            return cursor.fetchone()
+
+        return cursor.fetchall()
+
+    async def __run(self, func, *args):
+        """
+        Use this method to run a function in the pool executor
+
+        :param func: Function
+        :type func: :obj:`typing.Callable`
+
+        :return: Returns the function result
+        :rtype: :obj:`typing.Any`
+        """
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.size,
+                thread_name_prefix='sqlite')
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.__executor, func, *args)
+
+    async def transaction(self, func, *args):
+        """
+        Use this method to run a function with a cursor inside
+        a write transaction
+
+        :param func: Function called with a cursor and args
+        :type func: :obj:`typing.Callable`
+
+        :return: Returns the function result
+        :rtype: :obj:`typing.Any`
+        """
+        return await self.__run(self.__transaction, func, args)
+
+    async def execute(self, sql: str, parameters=()):
+        """
+        Use this method to run a write query
+
+        :param sql: SQL query
+        :type sql: :obj:`str`
+        :param parameters: Query parameters
+        :type parameters: :obj:`typing.Sequence`
+
+        :return: Returns the number of modified rows
+        :rtype: :obj:`int`
+        """
+        return await self.transaction(
+            lambda cursor: cursor.execute(sql, parameters).rowcount)
+
+    async def executemany(self, sql: str, seq_of_parameters):
+        """
+        Use this method to run a write query for every parameters
+        sequence in one transaction
+
+        :param sql: SQL query
+        :type sql: :obj:`str`
+        :param seq_of_parameters: Query parameters sequences
+        :type seq_of_parameters: :obj:`typing.Iterable`
+
+        :return: Returns the number of modified rows
+        :rtype: :obj:`int`
+        """
+        return await self.transaction(
+            lambda cursor: cursor.executemany(sql, seq_of_parameters).rowcount)
+
+    async def fetchone(self, sql: str, parameters=()):
+        """
+        Use this method to fetch one row
+
+        :param sql: SQL query
+        :type sql: :obj:`str`
+        :param parameters: Query parameters
+        :type parameters: :obj:`typing.Sequence`
+
+        :return: On success, returns a row
+        :rtype: :obj:`typing.Union[None, tuple]`
+        """
+        return await self.__run(self.__query, sql, parameters, 1)
+
+    async def fetchall(self, sql: str, parameters=()):
+        """
+        Use this method to fetch all rows
+
+        :param sql: SQL query
+        :type sql: :obj:`str`
+        :param parameters: Query parameters
+        :type parameters: :obj:`typing.Sequence`
+
+        :return: Returns a list of rows
+        :rtype: :obj:`list`
+        """
+        return await self.__run(self.__query, sql, parameters, 0)
+
+    async def close(self):
+        """
+        Use this method to close all connections and stop the executor
+        """
+        if self.__executor is None:
+            return
+
+        executor = self.__executor
+        self.__executor = None
+
+        await asyncio.get_running_loop().run_in_executor(
+            None, executor.shutdown)
+
+        with self.__lock:
+            for connect in self.__connections:
+                connect.close()
+
+            self.__connections.clear()
+
+        self.__local = threading.local()
+
+
+class WriteBuffer:
+    """
+    Base group commit buffer class
+
+    Rows added within the flush delay, up to the buffer size, are
+    written in one transaction, so one commit serves many writers.
+    A write resolves once its transaction has committed.
+    """
+
+    def __init__(self, pool: ConnectionPool, sql: str,
+                 delay: float = 0.005, size: int = 100) -> None:
+        """
+        :param pool: Connection pool
+        :type pool: :obj:`ConnectionPool`
+        :param sql: SQL query run for every row
+        :type sql: :obj:`str`
+        :param delay: Seconds to collect rows before writing them
+        :type delay: :obj:`float`
+        :param size: Number of rows written at once without waiting
+        :type size: :obj:`int`
+        """
+        self.pool = pool
+        self.sql = sql
+        self.delay = delay
+        self.size = size
+
+        self.rows = []
+        self.futures = []
+        self.timer = None
+        self.writes = set()
+
+    async def add(self, parameters):
+        """
+        Use this method to write a row
+
+        :param parameters: Query parameters
+        :type parameters: :obj:`typing.Sequence`
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        self.rows.append(parameters)
+        self.futures.append(future)
+
+        if len(self.rows) >= self.size:
+            self.__flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.delay, self.__flush)
+
+        await future
+
+    def __flush(self):
+        """
+        Use this method to start writing the buffered rows
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self.rows:
+            return
+
+        rows, futures = self.rows, self.futures
+        self.rows, self.futures = [], []
+
+        task = asyncio.get_running_loop().create_task(self.__write(rows, futures))
+        self.writes.add(task)
+        task.add_done_callback(self.writes.discard)
+
+    async def __write(self, rows: list, futures: list):
+        """
+        Use this method to write rows in one transaction
+        """
+        try:
+            await self.pool.executemany(self.sql, rows)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+            return
+
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def flush(self):
+        """
+        Use this method to write the buffered rows and wait for all writes
+        """
+        self.__flush()
+
+        if self.writes:
+            await asyncio.wait(list(self.writes))
@@ -0,0 +1,278 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+import typing
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from src.metrics import API, SEND_QUEUE, Metrics
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+# priority of Bot API sends made from the current context
+priority = contextvars.ContextVar('send_priority', default=INTERACTIVE)
+
+THROTTLED_METHODS = ('send', 'edit', 'copy', 'forward')
+
+
+class TokenBucket:
+    """
+    Base token bucket class
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        """
+        :param rate: Tokens per second
+        :type rate: :obj:`float`
+        :param capacity: Maximum number of tokens
+        :type capacity: :obj:`float`
+        :param now: Current time
+        :type now: :obj:`float`
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        """
+        Use this method to add the tokens accumulated since the last update
+
+        :param now: Current time
+        :type now: :obj:`float`
+
+        :return: Returns the number of tokens
+        :rtype: :obj:`float`
+        """
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        return self.tokens
+
+    def reserve(self, now: float) -> float:
+        """
+        Use this method to take a token, possibly from the future
+
+        :param now: Current time
+        :type now: :obj:`float`
+
+        :return: Returns seconds to wait until the token is available
+        :rtype: :obj:`float`
+        """
+        self.tokens = self.refill(now) - 1
+
+        if self.tokens >= 0:
+            return 0.0
+
+        return -self.tokens / self.rate
+
+    def pause(self, now: float, seconds: float):
+        """
+        Use this method to hold back the bucket
+
+        :param now: Current time
+        :type now: :obj:`float`
+        :param seconds: Seconds without tokens
+        :type seconds: :obj:`float`
+        """
+        # the next reservation takes the last token and waits the full pause
+        self.tokens = min(self.refill(now), 1) - seconds * self.rate
+
+
+class SendScheduler:
+    """
+    Base Bot API send scheduler class
+
+    Sends are limited by a token bucket per chat and a global token
+    bucket. Sends waiting for a global token are served by priority,
+    so interactive replies go ahead of bulk traffic. The wait of every
+    send is recorded in a histogram by priority.
+    """
+
+    def __init__(self, rate: float = 30, chat_rate: float = 1,
+                 chat_burst: float = 3, max_chats: int = 10000) -> None:
+        """
+        :param rate: Global sends per second
+        :type rate: :obj:`float`
+        :param chat_rate: Sends per second to one chat
+        :type chat_rate: :obj:`float`
+        :param chat_burst: Sends to one chat allowed at once
+        :type chat_burst: :obj:`float`
+        :param max_chats: Number of chat buckets kept before idle ones are dropped
+        :type max_chats: :obj:`int`
+        """
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+
+        self.bucket = None
+        self.chat_buckets = {}
+        self.queue = []
+        self.task = None
+        self.__seq = itertools.count()
+
+        # sends waiting for a token
+        self.waiting = 0
+
+    def __chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        """
+        Use this method to get the token bucket of a chat
+        """
+        bucket = self.chat_buckets.get(chat_id)
+
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chats:
+                # full buckets belong to idle chats
+                self.chat_buckets = {
+                    chat: bucket for chat, bucket in self.chat_buckets.items()
+                    if bucket.refill(now) < bucket.capacity}
+
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self.chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    async def __serve(self):
+        """
+        Use this method to release queued sends at the global rate
+        """
+        loop = asyncio.get_running_loop()
+
+        while self.queue:
+            delay = self.bucket.reserve(loop.time())
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            _, _, future = heapq.heappop(self.queue)
+
+            if not future.done():
+                future.set_result(None)
+
+        self.task = None
+
+    async def acquire(self, chat_id=None, send_priority: int = INTERACTIVE):
+        """
+        Use this method to wait until a send is allowed
+
+        :param chat_id: Chat ID
+        :type chat_id: :obj:`typing.Union[None, int, str]`
+        :param send_priority: Send priority, lower goes first
+        :type send_priority: :obj:`int`
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        if self.bucket is None:
+            self.bucket = TokenBucket(self.rate, self.rate, start)
+
+        self.waiting += 1
+
+        try:
+            if chat_id is not None:
+                delay = self.__chat_bucket(chat_id, start).reserve(start)
+
+                if delay:
+                    await asyncio.sleep(delay)
+
+            future = loop.create_future()
+            heapq.heappush(
+                self.queue, (send_priority, next(self.__seq), future))
+
+            if self.task is None:
+                self.task = loop.create_task(self.__serve())
+
+            await future
+        finally:
+            self.waiting -= 1
+
+        Metrics.observe(
+            SEND_QUEUE, PRIORITY_NAMES.get(send_priority, str(send_priority)),
+            loop.time() - start)
+
+    def pause(self, chat_id, seconds: float):
+        """
+        Use this method to hold back sends to a chat after flood control
+
+        :param chat_id: Chat ID, None holds back all sends
+        :type chat_id: :obj:`typing.Union[None, int, str]`
+        :param seconds: Seconds without sends
+        :type seconds: :obj:`float`
+        """
+        now = asyncio.get_running_loop().time()
+
+        if chat_id is None:
+            if self.bucket is None:
+                self.bucket = TokenBucket(self.rate, self.rate, now)
+
+            self.bucket.pause(now, seconds)
+        else:
+            self.__chat_bucket(chat_id, now).pause(now, seconds)
+
+
+class ThrottledBot(Bot):
+    """
+    Bot whose sends go through a send scheduler
+    """
+
+    def __init__(self, token: str, scheduler: SendScheduler,
+                 retries: int = 3, **kwargs) -> None:
+        """
+        :param token: Bot token
+        :type token: :obj:`str`
+        :param scheduler: Send scheduler
+        :type scheduler: :obj:`SendScheduler`
+        :param retries: Number of retries after flood control errors
+        :type retries: :obj:`int`
+        """
+        super().__init__(token, **kwargs)
+
+        self.scheduler = scheduler
+        self.retries = retries
+
+    async def __request(self, method: str,
+                        data: typing.Optional[typing.Dict] = None,
+                        files: typing.Optional[typing.Dict] = None, **kwargs):
+        """
+        Use this method to make a request and record its latency
+        """
+        start = time.perf_counter()
+
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            Metrics.error(method)
+            raise
+        finally:
+            Metrics.observe(API, method, time.perf_counter() - start)
+
+    async def request(self, method: str,
+                      data: typing.Optional[typing.Dict] = None,
+                      files: typing.Optional[typing.Dict] = None, **kwargs):
+        if not method.startswith(THROTTLED_METHODS):
+            return await self.__request(method, data, files, **kwargs)
+
+        chat_id = (data or {}).get('chat_id')
+        attempt = 0
+
+        while True:
+            await self.scheduler.acquire(chat_id, priority.get())
+
+            try:
+                return await self.__request(method, data, files, **kwargs)
+            except RetryAfter as e:
+                # uploaded file streams cannot be sent again
+                if files or attempt >= self.retries:
+                    raise
+
+                attempt += 1
+                self.scheduler.pause(chat_id, e.timeout * attempt)
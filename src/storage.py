@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import typing
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from src.metrics import DB, Metrics
+from src.pool import ConnectionPool
+
+log = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    SQLite based states storage.
+
+    States and data survive restarts. Recently used records are kept in
+    a bounded LRU cache as compact (state, JSON data) pairs, and records
+    untouched for longer than the TTL are evicted. Expired records are
+    deleted from the database by a background task.
+    """
+
+    def __init__(self, path: str, cache_size: int = 10000,
+                 ttl: typing.Optional[float] = None) -> None:
+        """
+        :param path: Database file path
+        :type path: :obj:`str`
+        :param cache_size: Maximum number of cached records
+        :type cache_size: :obj:`int`
+        :param ttl: Seconds a record lives without updates, None keeps records forever
+        :type ttl: :obj:`typing.Optional[float]`
+        """
+        self.pool = ConnectionPool(path)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.ttl = ttl
+
+        self.__created = False
+        self.task = None
+
+    async def __create(self):
+        """
+        Use this method to create the states table
+        """
+        def create_table(cursor: sqlite3.Cursor):
+            cursor.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS
+                states(
+                    chat_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    state TEXT,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (chat_id, user_id))
+                ''')
+
+            cursor.execute(
+                '''
+                CREATE INDEX IF NOT EXISTS
+                states_updated ON states(updated)
+                ''')
+
+        await self.pool.transaction(create_table)
+        self.__created = True
+
+    def __expired(self, updated: float, now: float) -> bool:
+        """
+        Use this method to check whether a record outlived the TTL
+        """
+        return self.ttl is not None and updated < now - self.ttl
+
+    @Metrics.timed(DB, 'states.get')
+    async def __get(self, chat, user) -> list:
+        """
+        Use this method to get a record as [state, JSON data, update time]
+        """
+        key = tuple(map(int, self.check_address(chat=chat, user=user)))
+        record = self.cache.get(key)
+        now = time.time()
+
+        if record is None:
+            if not self.__created:
+                await self.__create()
+
+            record = await self.pool.fetchone(
+                '''
+                SELECT state, data, updated FROM states
+                WHERE chat_id = ? AND user_id = ?
+                ''',
+                key)
+
+            record = list(record) if record is not None else [None, '{}', now]
+            self.cache[key] = record
+
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+
+        if self.__expired(record[2], now):
+            record[:] = [None, '{}', now]
+
+        return record
+
+    @Metrics.timed(DB, 'states.set')
+    async def __set(self, chat, user, state: typing.Optional[str], data: str):
+        """
+        Use this method to write a record through to the database
+        """
+        key = tuple(map(int, self.check_address(chat=chat, user=user)))
+        now = time.time()
+
+        record = await self.__get(chat, user)
+        record[:] = [state, data, now]
+
+        if state is None and data == '{}':
+            await self.pool.execute(
+                '''
+                DELETE FROM states
+                WHERE chat_id = ? AND user_id = ?
+                ''',
+                key)
+        else:
+            await self.pool.execute(
+                '''
+                INSERT OR REPLACE INTO states(chat_id, user_id, state, data, updated)
+                VALUES(?, ?, ?, ?, ?)
+                ''',
+                [*key, state, data, now])
+
+    @Metrics.timed(DB, 'states.purge')
+    async def purge(self) -> int:
+        """
+        Use this method to delete records that outlived the TTL
+
+        :return: Returns the number of deleted records
+        :rtype: :obj:`int`
+        """
+        if self.ttl is None:
+            return 0
+
+        if not self.__created:
+            await self.__create()
+
+        return await self.pool.execute(
+            '''
+            DELETE FROM states
+            WHERE updated < ?
+            ''',
+            [time.time() - self.ttl])
+
+    async def watch(self):
+        """
+        Use this method to purge expired records 24 times per TTL
+        """
+        while True:
+            try:
+                await self.purge()
+            except Exception:
+                log.exception('Expired states are not purged')
+
+            await asyncio.sleep(self.ttl / 24)
+
+    def start(self):
+        """
+        Use this method to start purging expired records in the background
+        """
+        if self.ttl is not None and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.watch())
+
+    def stop(self):
+        """
+        Use this method to stop purging expired records
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self.__get(chat, user)
+
+        if record[0] is None:
+            return self.resolve_state(default)
+
+        return record[0]
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[typing.Dict] = None) -> typing.Dict:
+        record = await self.__get(chat, user)
+
+        if record[1] == '{}':
+            return dict(default or {})
+
+        return json.loads(record[1])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        record = await self.__get(chat, user)
+
+        await self.__set(chat, user, self.resolve_state(state), record[1])
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        record = await self.__get(chat, user)
+
+        await self.__set(chat, user, record[0], json.dumps(
+            data or {}, ensure_ascii=False, separators=(',', ':')))
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        record = await self.__get(chat, user)
+        new_data = json.loads(record[1])
+        new_data.update(data or {}, **kwargs)
+
+        await self.set_data(chat=chat, user=user, data=new_data)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        record = await self.__get(chat, user)
+
+        await self.__set(chat, user, None, '{}' if with_data else record[1])
+
+    @Metrics.timed(DB, 'states.count')
+    async def count_states(self) -> typing.Dict[str, int]:
+        """
+        Use this method to count users by state
+
+        :return: Returns numbers of users by state
+        :rtype: :obj:`typing.Dict[str, int]`
+        """
+        if not self.__created:
+            await self.__create()
+
+        rows = await self.pool.fetchall(
+            '''
+            SELECT state, COUNT(*) FROM states
+            WHERE state IS NOT NULL AND updated >= ?
+            GROUP BY state
+            ''',
+            [time.time() - self.ttl if self.ttl is not None else 0])
+
+        return dict(rows)
+
+    async def close(self):
+        self.stop()
+        self.cache.clear()
+        await self.pool.close()
+
+    async def wait_closed(self):
+        pass
@@ -1,7 +1,212 @@
+import asyncio
 import json
+import logging
 import os
 
+from aiogram import types
+
 import src.config as config
+from src.config import bot
+from src.content import Content
+from src.sender import BULK, priority
+
+log = logging.getLogger(__name__)
+
+
+class TGFileStore:
+    """
+    Base Telegram file ids store class
+
+    Updates stay in memory and are written to disk in coalesced batches,
+    off the event loop, through a temporary file and an atomic rename.
+    """
+
+    dirty = False
+    task = None
+    lock = asyncio.Lock()
+
+    def write(path: str, data: str):
+        """
+        Use this method to atomically replace a file
+
+        :param path: File path
+        :type path: :obj:`str`
+        :param data: File content
+        :type data: :obj:`str`
+        """
+        tmp_path = f'{path}.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+
+        os.replace(tmp_path, path)
+
+    def schedule():
+        """
+        Use this method to mark file ids as changed and schedule a flush
+        """
+        TGFileStore.dirty = True
+
+        if TGFileStore.task is None:
+            TGFileStore.task = asyncio.get_running_loop().create_task(
+                TGFileStore.flush_later())
+
+    async def flush_later():
+        """
+        Use this method to flush file ids after the flush delay
+        """
+        await asyncio.sleep(config.FILES_FLUSH_DELAY)
+
+        TGFileStore.task = None
+
+        # file ids stay dirty after a failed write, the next flush retries
+        try:
+            await TGFileStore.flush()
+        except OSError as e:
+            log.error('File ids are not saved: %s', e)
+            TGFileStore.schedule()
+
+    async def flush():
+        """
+        Use this method to write changed file ids to disk
+        """
+        async with TGFileStore.lock:
+            if not TGFileStore.dirty:
+                return
+
+            TGFileStore.dirty = False
+
+            # entries are replaced, never mutated, so a shallow copy is a snapshot
+            files = dict(config.FILES)
+            loop = asyncio.get_running_loop()
+
+            try:
+                await loop.run_in_executor(
+                    None, lambda: TGFileStore.write(
+                        'data/json/id.json',
+                        json.dumps(obj=files, ensure_ascii=False, indent=4)))
+            except BaseException:
+                TGFileStore.dirty = True
+                raise
+
+    async def close():
+        """
+        Use this method to cancel the scheduled flush and flush immediately
+        """
+        if TGFileStore.task is not None:
+            TGFileStore.task.cancel()
+            TGFileStore.task = None
+
+        await TGFileStore.flush()
+
+
+class TGFileIndex:
+    """
+    Base media index class
+
+    Modification times of the files in data/img and data/vid are scanned
+    once at startup and kept current by a periodic scandir diff, so
+    freshness checks are dict lookups.
+    """
+
+    mtimes = {'img': {}, 'vid': {}}
+    task = None
+
+    def scan(folder: str):
+        """
+        Use this method to scan modification times of a media folder
+
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+
+        :return: Returns modification times by file name
+        :rtype: :obj:`dict`
+        """
+        with os.scandir(f'data/{folder}') as entries:
+            return {entry.name: entry.stat().st_mtime
+                    for entry in entries if entry.is_file()}
+
+    def mtime(folder: str, file: str):
+        """
+        Use this method to get the indexed modification time of a file
+
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+        :param file: File name
+        :type file: :obj:`str`
+
+        :return: Returns the modification time, None if the file is unknown
+        :rtype: :obj:`typing.Union[None, float]`
+        """
+        return TGFileIndex.mtimes[folder].get(file)
+
+    async def add(folder: str, file: str):
+        """
+        Use this method to index a file that is not indexed yet
+
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+        :param file: File name
+        :type file: :obj:`str`
+
+        :return: Returns the modification time
+        :rtype: :obj:`float`
+        """
+        mtime = TGFileIndex.mtime(folder, file)
+
+        if mtime is None:
+            mtime = await asyncio.get_running_loop().run_in_executor(
+                None, os.path.getmtime, f'data/{folder}/{file}')
+
+            TGFileIndex.mtimes[folder][file] = mtime
+
+        return mtime
+
+    async def refresh():
+        """
+        Use this method to rescan media folders off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        mtimes = {}
+
+        for folder in TGFileIndex.mtimes:
+            mtimes[folder] = await loop.run_in_executor(
+                None, TGFileIndex.scan, folder)
+
+        TGFileIndex.mtimes = mtimes
+
+    async def watch():
+        """
+        Use this method to rescan media folders every scan interval
+        """
+        while True:
+            await asyncio.sleep(config.MEDIA_SCAN_INTERVAL)
+
+            # a failed scan keeps the index in use, the next scan retries
+            try:
+                await TGFileIndex.refresh()
+            except Exception:
+                log.exception('Media folders are not rescanned')
+
+    async def start():
+        """
+        Use this method to build the index and start watching media folders
+        """
+        await TGFileIndex.refresh()
+
+        if config.MEDIA_SCAN_INTERVAL and TGFileIndex.task is None:
+            TGFileIndex.task = asyncio.get_running_loop().create_task(
+                TGFileIndex.watch())
+
+    async def stop():
+        """
+        Use this method to stop watching media folders
+        """
+        if TGFileIndex.task is not None:
+            TGFileIndex.task.cancel()
+            TGFileIndex.task = None
 
 
 class TGFileGet:
@@ -36,13 +241,11 @@ class TGFileAdd:
         :param id: File identifier
         :type id: :obj:`str`
         """
-        config.FILES[file] = {}
-        config.FILES[file]['id'] = id
-        config.FILES[file]['mtime'] = os.path.getmtime(f'data/img/{file}')
+        config.FILES[file] = {
+            'id': id,
+            'mtime': await TGFileIndex.add('img', file)}
 
-        with open(f'data/json/id.json', 'w', encoding='utf-8') as id_file:
-            json.dump(obj=config.FILES, fp=id_file,
-                      ensure_ascii=False, indent=4)
+        TGFileStore.schedule()
 
     async def vid(file: str, id: str):
         """
@@ -53,13 +256,11 @@ class TGFileAdd:
         :param id: File identifier
         :type id: :obj:`str`
         """
-        config.FILES[file] = {}
-        config.FILES[file]['id'] = id
-        config.FILES[file]['mtime'] = os.path.getmtime(f'data/vid/{file}')
+        config.FILES[file] = {
+            'id': id,
+            'mtime': await TGFileIndex.add('vid', file)}
 
-        with open(f'data/json/id.json', 'w', encoding='utf-8') as id_file:
-            json.dump(obj=config.FILES, fp=id_file,
-                      ensure_ascii=False, indent=4)
+        TGFileStore.schedule()
 
 
 class TGFileExist:
@@ -80,7 +281,7 @@ class TGFileExist:
         if (file in config.FILES and
             'id' in config.FILES[file] and
             'mtime' in config.FILES[file] and
-                os.path.getmtime(f'data/img/{file}') == config.FILES[file]['mtime']):
+                TGFileIndex.mtime('img', file) == config.FILES[file]['mtime']):
             return True
 
         return False
@@ -98,12 +299,280 @@ class TGFileExist:
         if (file in config.FILES and
             'id' in config.FILES[file] and
             'mtime' in config.FILES[file] and
-                os.path.getmtime(f'data/vid/{file}') == config.FILES[file]['mtime']):
+                TGFileIndex.mtime('vid', file) == config.FILES[file]['mtime']):
             return True
 
         return False
 
 
+class TGFileSend:
+    """
+    Base send Telegram file class
+
+    The first send of an uncached file uploads it, concurrent sends
+    of the same file wait for its id instead of uploading it again.
+    """
+
+    uploads = {}
+
+    async def wait(folder: str, file: str):
+        """
+        Use this method to wait for an upload of the file in progress
+
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+        :param file: File name
+        :type file: :obj:`str`
+        """
+        upload = TGFileSend.uploads.get((folder, file))
+
+        if upload is not None:
+            await asyncio.shield(upload)
+
+    async def media(folder: str, file: str, send, exist, add, file_id):
+        """
+        Use this method to send a media file by its id or upload it once
+
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+        :param file: File name
+        :type file: :obj:`str`
+        :param send: Function called with a file id or an input file,
+            returns the sent message
+        :type send: :obj:`typing.Callable`
+        :param exist: File id exist method
+        :type exist: :obj:`typing.Callable`
+        :param add: File id add method
+        :type add: :obj:`typing.Callable`
+        :param file_id: Function returning the file id of the sent message
+        :type file_id: :obj:`typing.Callable`
+
+        :return: On success, returns the sent message
+        :rtype: :obj:`types.Message`
+        """
+        key = (folder, file)
+
+        # a failed upload wakes up waiters and the next one uploads
+        while key in TGFileSend.uploads:
+            await TGFileSend.wait(folder, file)
+
+        if await exist(file):
+            return await send(await TGFileGet.file_id(file))
+
+        upload = asyncio.get_running_loop().create_future()
+        TGFileSend.uploads[key] = upload
+
+        try:
+            send_msg = await send(types.InputFile(f'data/{folder}/{file}'))
+            await add(file, file_id(send_msg))
+        finally:
+            del TGFileSend.uploads[key]
+            upload.set_result(None)
+
+        return send_msg
+
+    async def img(file: str, send):
+        """
+        Use this method to send an image file
+
+        :param file: File name
+        :type file: :obj:`str`
+        :param send: Function called with a file id or an input file,
+            returns the sent message
+        :type send: :obj:`typing.Callable`
+
+        :return: On success, returns the sent message
+        :rtype: :obj:`types.Message`
+        """
+        return await TGFileSend.media(
+            'img', file, send, TGFileExist.img, TGFileAdd.img,
+            lambda send_msg: send_msg.photo[-1].file_id)
+
+    async def img_group(files: list, send):
+        """
+        Use this method to send images in one media group, uploading every
+        uncached image once
+
+        Uploads of the group are registered like single uploads, so
+        concurrent sends of its images wait for their ids.
+
+        :param files: File names
+        :type files: :obj:`list`
+        :param send: Function called with a file id or an input file for
+            every image, returns the sent messages
+        :type send: :obj:`typing.Callable`
+
+        :return: On success, returns the sent messages
+        :rtype: :obj:`typing.List[types.Message]`
+        """
+        keys = [('img', file) for file in files]
+
+        # wait for uploads in progress without holding any, so two groups
+        # of the same images cannot wait for each other
+        while True:
+            pending = [key for key in keys if key in TGFileSend.uploads]
+
+            if not pending:
+                break
+
+            await TGFileSend.wait(*pending[0])
+
+        loop = asyncio.get_running_loop()
+        uploads = {}
+        photos = []
+
+        for key in keys:
+            if await TGFileExist.img(key[1]):
+                photos.append(await TGFileGet.file_id(key[1]))
+                continue
+
+            if key not in uploads:
+                uploads[key] = loop.create_future()
+                TGFileSend.uploads[key] = uploads[key]
+
+            photos.append(types.InputFile(f'data/{key[0]}/{key[1]}'))
+
+        try:
+            send_msgs = await send(photos)
+
+            for key, photo, send_msg in zip(keys, photos, send_msgs):
+                if isinstance(photo, types.InputFile):
+                    await TGFileAdd.img(key[1], send_msg.photo[-1].file_id)
+        finally:
+            for key, upload in uploads.items():
+                del TGFileSend.uploads[key]
+                upload.set_result(None)
+
+        return send_msgs
+
+    async def vid(file: str, send):
+        """
+        Use this method to send a video file
+
+        :param file: File name
+        :type file: :obj:`str`
+        :param send: Function called with a file id or an input file,
+            returns the sent message
+        :type send: :obj:`typing.Callable`
+
+        :return: On success, returns the sent message
+        :rtype: :obj:`types.Message`
+        """
+        return await TGFileSend.media(
+            'vid', file, send, TGFileExist.vid, TGFileAdd.vid,
+            lambda send_msg: send_msg.video.file_id)
+
+
+class TGFileWarmup:
+    """
+    Base Telegram file warm-up class
+
+    Task media without a valid file id are uploaded to a storage chat
+    before users request them.
+    """
+
+    task = None
+
+    def files():
+        """
+        Use this method to get media files referenced by learn tasks
+
+        :return: Returns (media folder name, file name) pairs
+        :rtype: :obj:`list`
+        """
+        learn = Content.current.learn
+
+        files = [('img', task.image) for task in learn.talk]
+        files += [('vid', task.video) for task in learn.listen]
+
+        return list(dict.fromkeys(files))
+
+    async def upload(chat_id: int, folder: str, file: str):
+        """
+        Use this method to upload a media file to a chat
+
+        :param chat_id: Chat ID
+        :type chat_id: :obj:`int`
+        :param folder: Media folder name
+        :type folder: :obj:`str`
+        :param file: File name
+        :type file: :obj:`str`
+        """
+        if folder == 'img':
+            await TGFileSend.img(
+                file,
+                lambda photo: bot.send_photo(
+                    chat_id, photo, caption=file,
+                    disable_notification=True))
+        else:
+            await TGFileSend.vid(
+                file,
+                lambda video: bot.send_video(
+                    chat_id, video, caption=file,
+                    disable_notification=True))
+
+    async def run(chat_id: int):
+        """
+        Use this method to upload all task media without a valid file id.
+        Uploads go one at a time, sends to one chat are paced by its
+        token bucket anyway.
+
+        :param chat_id: Storage chat ID
+        :type chat_id: :obj:`int`
+
+        :return: Returns the number of uploaded files
+        :rtype: :obj:`int`
+        """
+        exist = {'img': TGFileExist.img, 'vid': TGFileExist.vid}
+        files = [(folder, file) for folder, file in TGFileWarmup.files()
+                 if not await exist[folder](file)]
+
+        if not files:
+            return 0
+
+        uploaded = 0
+
+        log.info('Warm-up: uploading %d media files', len(files))
+
+        # warm-up uploads yield to user replies
+        token = priority.set(BULK)
+
+        try:
+            for folder, file in files:
+                try:
+                    await TGFileWarmup.upload(chat_id, folder, file)
+                except Exception:
+                    log.exception('Warm-up: failed to upload %s/%s', folder, file)
+                    continue
+
+                uploaded += 1
+                log.info('Warm-up: %d/%d %s/%s',
+                         uploaded, len(files), folder, file)
+        finally:
+            priority.reset(token)
+
+        return uploaded
+
+    def start(chat_id: int):
+        """
+        Use this method to start uploading task media in the background
+
+        :param chat_id: Storage chat ID
+        :type chat_id: :obj:`int`
+        """
+        if TGFileWarmup.task is None:
+            TGFileWarmup.task = asyncio.get_running_loop().create_task(
+                TGFileWarmup.run(chat_id))
+
+    async def stop():
+        """
+        Use this method to stop uploading task media
+        """
+        if TGFileWarmup.task is not None:
+            TGFileWarmup.task.cancel()
+            TGFileWarmup.task = None
+
+
 class TGFile:
     """
     Base Telegram file class
@@ -112,3 +581,7 @@ class TGFile:
     exist = TGFileExist
     add = TGFileAdd
     get = TGFileGet
+    store = TGFileStore
+    index = TGFileIndex
+    send = TGFileSend
+    warmup = TGFileWarmup
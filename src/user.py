@@ -1,13 +1,21 @@
+import re
+
 from aiogram import types
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.dispatcher.storage import FSMContext
+from aiogram.utils.parts import MAX_MESSAGE_LENGTH
 
 import src.config as config
-from src.config import bot
+from src.config import bot, dp
+from src.content import Content
 from src.database import Database
 from src.learn import Learn
 from src.tgfiles import TGFile
 
+MEDIA_GROUP_SIZE = 10
+
+learn = Learn()
+
 
 class UserState(StatesGroup):
     """
@@ -38,87 +46,256 @@ class Admin:
         """
         self.id = user_id
 
-    async def command_answer(self):
+    async def __finish_review(self, review: list):
+        """
+        Use this method to finish the review: unanswered answers
+        return to the queue. Answered answers are already removed.
+
+        :param review: Review entries
+        :type review: :obj:`list`
+        """
+        unanswered = [entry[0] for entry in review if not entry[4]]
+
+        if unanswered:
+            await Database.answers.release_many(unanswered, self.id)
+
+    async def __send_write(self, answers: list, numbered: bool):
+        """
+        Use this method to send write answers, joined into as few
+        messages as possible
+
+        :param answers: Answers as (number, review entry, task number, answer text)
+        :type answers: :obj:`list`
+        :param numbered: Prefix answers with their numbers
+        :type numbered: :obj:`bool`
+
+        :return: On success, returns the last sent message
+        :rtype: :obj:`types.Message`
+        """
+        content = Content.current
+        chunks = [[]]
+        chunk_len = 0
+
+        for num, entry, task_num, answer_text in answers:
+            msg_text = f'{content.learn.write[task_num].text}\n\n<b>Ответ:</b>\n{answer_text}'
+
+            if numbered:
+                msg_text = f'<b>№{num}</b>\n{msg_text}'
+
+            if chunks[-1] and chunk_len + len(msg_text) + 2 > MAX_MESSAGE_LENGTH:
+                chunks.append([])
+                chunk_len = 0
+
+            chunks[-1].append((entry, msg_text))
+            chunk_len += len(msg_text) + 2
+
+        for chunk in chunks:
+            send_msg = await bot.send_message(
+                self.id, '\n\n'.join(msg_text for _, msg_text in chunk),
+                parse_mode='html')
+
+            for entry, _ in chunk:
+                entry[3] = send_msg.message_id
+
+        return send_msg
+
+    async def __send_talk(self, answers: list, numbered: bool):
+        """
+        Use this method to send talk answers as media groups
+
+        :param answers: Answers as (number, review entry, task number, answer text)
+        :type answers: :obj:`list`
+        :param numbered: Prefix answers with their numbers
+        :type numbered: :obj:`bool`
+
+        :return: On success, returns the last sent message
+        :rtype: :obj:`types.Message`
+        """
+        content = Content.current
+
+        for i in range(0, len(answers), MEDIA_GROUP_SIZE):
+            chunk = []
+
+            for num, entry, task_num, answer_text in answers[i:i + MEDIA_GROUP_SIZE]:
+                msg_text = f'<b>Ответ:</b>\n{answer_text}'
+
+                if numbered:
+                    msg_text = f'<b>№{num}</b>\n{msg_text}'
+
+                chunk.append((entry, content.learn.talk[task_num].image, msg_text))
+
+            # a media group needs at least two items
+            if len(chunk) == 1:
+                entry, file, msg_text = chunk[0]
+
+                send_msgs = [await TGFile.send.img(
+                    file,
+                    lambda photo: bot.send_photo(
+                        chat_id=self.id,
+                        photo=photo,
+                        caption=msg_text,
+                        parse_mode='html'))]
+                entry[3] = send_msgs[0].message_id
+
+                continue
+
+            def send_group(photos: list):
+                media = types.MediaGroup()
+
+                for photo, (_, _, msg_text) in zip(photos, chunk):
+                    media.attach_photo(photo, caption=msg_text, parse_mode='html')
+
+                return bot.send_media_group(self.id, media)
+
+            send_msgs = await TGFile.send.img_group(
+                [file for _, file, _ in chunk], send_group)
+
+            for send_msg, (entry, _, _) in zip(send_msgs, chunk):
+                entry[3] = send_msg.message_id
+
+        return send_msgs[-1]
+
+    async def command_answer(self, count: int = 1):
         """
         Use this method to admin command answer
 
+        :param count: Number of answers to review at once
+        :type count: :obj:`int`
+
         :return: On success, returns the sent message, otherwise False
         :rtype: :obj:`typing.Union[bool, types.Message]`
         """
         if not await Database.admins.exist(self.id):
             return False
 
-        answer = await Database.answers.get_answer()
+        state = dp.current_state(chat=self.id, user=self.id)
+        data = await state.get_data()
+
+        # finish the previous review, unanswered answers return to the queue
+        if 'review' in data:
+            await self.__finish_review(data['review'])
+
+        count = max(1, min(count, config.ANSWER_BATCH_SIZE))
+        answers = await Database.answers.claim_many(self.id, count)
+
+        if not answers:
+            await state.finish()
 
-        if answer is None:
             return await bot.send_message(
                 chat_id=self.id,
                 text='Нет ответов, отправленных на проверку!')
 
-        ID, chat_id, message_id, task_type, task_num, answer_text = answer
+        review = []
+        talk_answers = []
+        write_answers = []
 
-        if task_type == 'talk':
-            msg_text = f'<b>Ответ:</b>\n{answer_text}'
+        for num, answer in enumerate(answers, 1):
+            ID, chat_id, message_id, task_type, task_num, answer_text = answer
 
-            await AdminState.task_answer.set()
-            config.ADMIN_ANSWERS[self.id] = [ID, chat_id, message_id]
+            # ID, chat ID, message ID, review message ID, answered or lease lost
+            entry = [ID, chat_id, message_id, None, False]
+            review.append(entry)
 
-            if await TGFile.exist.img(config.LEARN['Talk'][task_num]):
-                return await bot.send_photo(
-                    chat_id=self.id,
-                    photo=await TGFile.get.file_id(
-                        config.LEARN['Talk'][task_num]),
-                    caption=msg_text,
-                    parse_mode='html')
-            else:
-                send_msg = await bot.send_photo(
-                    chat_id=self.id,
-                    photo=types.InputFile(
-                        f'data/img/{config.LEARN["Talk"][task_num]}'),
-                    caption=msg_text,
-                    parse_mode='html')
+            if task_type == 'talk':
+                talk_answers.append((num, entry, task_num, answer_text))
+            elif task_type == 'write':
+                write_answers.append((num, entry, task_num, answer_text))
 
-                await TGFile.add.img(
-                    config.LEARN['Talk'][task_num],
-                    send_msg.photo[-1].file_id)
+        numbered = len(review) > 1
+        send_msg = None
 
-                return send_msg
-        elif task_type == 'write':
-            msg_text = f'{config.LEARN["Write"][task_num]}\n\n<b>Ответ:</b>\n{answer_text}'
+        # a batch that is not delivered whole returns to the queue at once
+        try:
+            if write_answers:
+                send_msg = await self.__send_write(write_answers, numbered)
 
-            await AdminState.task_answer.set()
-            config.ADMIN_ANSWERS[self.id] = [ID, chat_id, message_id]
+            if talk_answers:
+                send_msg = await self.__send_talk(talk_answers, numbered)
+        except Exception:
+            await state.finish()
+            await Database.answers.release_many([entry[0] for entry in review], self.id)
+            raise
 
-            return await bot.send_message(
-                self.id, msg_text,
-                parse_mode='html')
+        await state.set_state(AdminState.task_answer)
+        await state.set_data({'review': review})
+
+        return send_msg
 
-    async def answer(self, answer_text: str, state: FSMContext):
+    async def answer(self, answer_text: str, state: FSMContext, reply_to: int = None):
         """
-        Use this method to send the administrator's answer to the user
+        Use this method to send the administrator's answer to the user.
+        In a batch review the answer is matched by the replied message
+        or by its number at the start of the text.
 
         :param answer_text: Answer text
         :type answer_text: :obj:`str`
         :param state: Active state
         :type state: :obj:`FSMContext`
+        :param reply_to: ID of the replied review message
+        :type reply_to: :obj:`int`
 
         :return: On success, returns the sent message
         :rtype: :obj:`types.Message`
         """
-        await state.finish()
+        data = await state.get_data()
+
+        if 'review' not in data:
+            await state.finish()
 
-        if self.id not in config.ADMIN_ANSWERS:
             return await bot.send_message(
                 chat_id=self.id,
                 text='Похоже что-то пошло не так. 😔')
 
-        await bot.send_message(
-            chat_id=config.ADMIN_ANSWERS[self.id][1],
-            text=answer_text,
-            reply_to_message_id=config.ADMIN_ANSWERS[self.id][2])
+        review = data['review']
+        pending = [entry for entry in review if not entry[4]]
+        entry = None
+
+        if len(review) > 1:
+            replied = [entry for entry in pending if entry[3] == reply_to]
+            match = re.match(r'№?(\d+)[.)]?\s+(.+)', answer_text, re.DOTALL)
 
-        await Database.answers.remove(config.ADMIN_ANSWERS[self.id][0])
-        del config.ADMIN_ANSWERS[self.id]
+            if len(replied) == 1:
+                entry = replied[0]
+            elif (match and 0 < int(match.group(1)) <= len(review) and
+                    not review[int(match.group(1)) - 1][4]):
+                entry = review[int(match.group(1)) - 1]
+                answer_text = match.group(2)
+
+        if entry is None and len(pending) == 1:
+            entry = pending[0]
+
+        if entry is None:
+            return await bot.send_message(
+                chat_id=self.id,
+                text='Ответь на сообщение с ответом или начни текст с его номера, например: «2 Sehr gut!»')
+
+        # the lease is renewed before the reply, so the answer is not served
+        # to another admin meanwhile, and the answer is removed once replied to
+        if await Database.answers.renew(entry[0], self.id):
+            try:
+                send_msg = await bot.send_message(
+                    chat_id=entry[1],
+                    text=answer_text,
+                    reply_to_message_id=entry[2])
+            except Exception:
+                await Database.answers.release(entry[0], self.id)
+                raise
+
+            await Database.answers.remove(entry[0], self.id)
+        else:
+            send_msg = await bot.send_message(
+                chat_id=self.id,
+                text='Время проверки этого ответа истекло, он вернулся в очередь.')
+
+        entry[4] = True
+
+        if len(pending) == 1:
+            await state.finish()
+            await self.__finish_review(review)
+        else:
+            await state.update_data(review=review)
+
+        return send_msg
 
 
 class User:
@@ -146,170 +323,151 @@ class User:
         """
         Use this method to send the learn menu
         """
-        learn = Learn()
-
         await learn.menu.send(self.id)
 
     async def write_task_start(self, message_id: int):
         """
         Use this method to start the write task
         """
-        learn = Learn()
-
         await learn.menu.write_task(self.id, message_id)
 
     async def talk_task_start(self, message_id: int):
         """
         Use this method to start the talk task
         """
-        learn = Learn()
-
         await learn.menu.talk_task(self.id, message_id)
 
     async def listen_task_start(self, message_id: int):
         """
         Use this method to start the listen task
         """
-        learn = Learn()
-
         await learn.menu.listen_task(self.id, message_id)
 
     async def read_task_start(self, message_id: int):
         """
         Use this method to start the read task
         """
-        learn = Learn()
-
         await learn.menu.read_task(
             self.id, message_id)
 
-    async def talk_task(self, call: types.CallbackQuery):
+    async def talk_task(self, call: types.CallbackQuery, task: int):
         """
         Use this method to send the message with new random talk task
-        or its answers.
         """
-        learn = Learn()
-        data = call.data.split('_')
+        await learn.menu.talk_task(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task)
 
-        if len(data) == 2:
-            await learn.menu.talk_task(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[1]))
-        elif len(data) == 3:
-            await UserState.talk_answer.set()
+    async def talk_answer_start(self, call: types.CallbackQuery):
+        """
+        Use this method to wait for the answer to the user's talk task
+        """
+        await UserState.talk_answer.set()
 
-            await learn.menu.talk_answer_start(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id)
+        await learn.menu.talk_answer_start(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id)
 
     async def talk_answer(self, message: types.Message, state: FSMContext):
         """
         Use this method to save the answer to the user's talk task
         """
-        learn = Learn()
-
         await learn.menu.talk_answer_end(
             message.chat.id, message.message_id, message.text, state)
 
-    async def write_task(self, call: types.CallbackQuery):
+    async def write_task(self, call: types.CallbackQuery, task: int):
         """
         Use this method to send the message with new random write task
-        or its answers.
         """
-        learn = Learn()
-        data = call.data.split('_')
+        await learn.menu.write_task(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task)
 
-        if len(data) == 2:
-            await learn.menu.write_task(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[1]))
-        elif len(data) == 3:
-            await UserState.write_answer.set()
+    async def write_answer_start(self, call: types.CallbackQuery):
+        """
+        Use this method to wait for the answer to the user's write task
+        """
+        await UserState.write_answer.set()
 
-            await learn.menu.write_answer_start(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id)
+        await learn.menu.write_answer_start(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id)
 
     async def write_answer(self, message: types.Message, state: FSMContext):
         """
         Use this method to save the answer to the user's write task
         """
-        learn = Learn()
-
         await learn.menu.write_answer_end(
             message.chat.id, message.message_id, message.text, state)
 
-    async def listen_task(self, call: types.CallbackQuery):
+    async def listen_task(self, call: types.CallbackQuery, task: int):
         """
         Use this method to send the message with new random listen task
-        or its answers.
         """
-        learn = Learn()
-        data = call.data.split('_')
+        await learn.menu.listen_task(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task)
 
-        if len(data) == 2:
-            await learn.menu.listen_task(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[1]))
-        elif len(data) == 3:
-            await learn.menu.listen_answers(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[2]))
+    async def listen_answers(self, call: types.CallbackQuery, task: int):
+        """
+        Use this method to edit the message to the listen task answers
+        """
+        await learn.menu.listen_answers(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task)
 
-    async def read_task(self, call: types.CallbackQuery):
+    async def read_task(self, call: types.CallbackQuery, task: int):
         """
         Use this method to edit the message to the new random read task
-        or its result.
-        """
-        learn = Learn()
-        data = call.data.split('_')
-
-        if len(data) == 2:
-            await learn.menu.read_task(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[1]))
-        elif len(data) == 3:
-            task_answer: bool
-
-            if data[2] == 'correct':
-                task_answer = True
-            else:
-                task_answer = False
-
-            await learn.menu.read_result(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                task=int(data[1]),
-                answer=task_answer)
+        """
+        await learn.menu.read_task(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task)
+
+    async def read_result(self, call: types.CallbackQuery, task: int, answer: bool):
+        """
+        Use this method to edit the message to the read task result
+        """
+        await learn.menu.read_result(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            task=task,
+            answer=answer)
 
     async def command_info(self, message: types.Message):
         """
         Use this method to send information about the exam
         """
-        learn = Learn()
-
         await learn.exam_info(message.chat.id)
 
-    async def command_words(self, message: types.Message):
+    async def command_words(self, message: types.Message, query: str = ''):
         """
-        Use this method to send words with translation
+        Use this method to send words with translation, or the words closest to the query
         """
-        learn = Learn()
+        if query:
+            await learn.search_words(
+                message.chat.id, query,
+                config.WORDS_SEARCH_COUNT)
+        else:
+            await learn.words(message.chat.id)
 
-        await learn.words(message.chat.id)
-
-    async def words(self, call: types.CallbackQuery):
+    async def words(self, call: types.CallbackQuery, page: int):
         """
         Use this method to change the page of words with translation
         """
-        learn = Learn()
-        page = int(call.data.split('_')[-1])
-
         await learn.words(
             call.message.chat.id, page,
             call.message.message_id)
+
+    async def inline_words(self, inline_query: types.InlineQuery):
+        """
+        Use this method to search words with translation inline
+        """
+        await learn.inline_words(
+            inline_query.id, inline_query.query,
+            inline_query.offset)
@@ -0,0 +1,495 @@
+import heapq
+import json
+import re
+import typing
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+from aiogram import types
+from aiogram.types.inline_keyboard import (InlineKeyboardButton,
+                                           InlineKeyboardMarkup)
+
+import src.callbacks as callbacks
+from src.callbacks import CallbackData
+
+# letters folded when searching, so "hauser" finds "Häuser"
+FOLD = str.maketrans({'ä': 'a', 'ö': 'o', 'ü': 'u', 'ё': 'е'})
+# articles of nearly every German entry, not indexed as words
+STOP_TOKENS = frozenset(('der', 'die', 'das'))
+TOKEN = re.compile(r'\w+')
+# candidates checked by edit distance in one fuzzy search, most shared trigrams first
+FUZZY_CANDIDATES = 24
+# token postings of one trigram counted in a fuzzy search once rarer trigrams are counted
+FUZZY_POSTINGS = 700
+# query words matched in one fuzzy search, the rest are ignored
+FUZZY_QUERY_WORDS = 5
+
+
+class WordPages:
+    """
+    Base words pages class
+
+    Every page of the word list is rendered once. Pages are shared
+    between updates and must not be modified.
+    """
+
+    def __init__(self, words: typing.Sequence[str], count: int = 10) -> None:
+        """
+        :param words: Words with translation
+        :type words: :obj:`typing.Sequence[str]`
+        :param count: Maximum number of words per page
+        :type count: :obj:`int`
+        """
+        self.count = count
+        self.pages = [
+            WordPages.render(words, page, count)
+            for page in range(max(1, -(-len(words) // count)))]
+
+    def text(title: str, words: typing.Sequence[str]) -> str:
+        """
+        Use this method to render a list of words
+
+        :param title: List title, HTML
+        :type title: :obj:`str`
+        :param words: Words with translation
+        :type words: :obj:`typing.Sequence[str]`
+
+        :return: Returns the message text
+        :rtype: :obj:`str`
+        """
+        return '\n'.join([f'<b>{title}</b>\n', *words])
+
+    def render(words: typing.Sequence[str], page: int, count: int):
+        """
+        Use this method to render a words page
+
+        :param words: Words with translation
+        :type words: :obj:`typing.Sequence[str]`
+        :param page: Page number
+        :type page: :obj:`int`
+        :param count: Maximum number of words per page
+        :type count: :obj:`int`
+
+        :return: Returns the page text and keyboard
+        :rtype: :obj:`typing.Tuple[str, InlineKeyboardMarkup]`
+        """
+        inline_keyboard = InlineKeyboardMarkup()
+        fst_word = page * count
+        until_word = min((page + 1) * count, len(words))
+        buttons = []
+
+        msg_text = WordPages.text(f'Страница {page + 1}', words[fst_word:until_word])
+
+        if fst_word != 0:
+            buttons.append(
+                InlineKeyboardButton(
+                    text='« Назад',
+                    callback_data=CallbackData.pack(callbacks.WORDS_PAGE, page - 1)))
+
+        if until_word < len(words):
+            buttons.append(
+                InlineKeyboardButton(
+                    text='Далее »',
+                    callback_data=CallbackData.pack(callbacks.WORDS_PAGE, page + 1)))
+
+        inline_keyboard.add(*buttons)
+
+        return msg_text, inline_keyboard
+
+    def get(self, page: int):
+        """
+        Use this method to get a rendered page
+
+        :param page: Page number
+        :type page: :obj:`int`
+
+        :return: Returns the page text and keyboard, None if there is no such page
+        :rtype: :obj:`typing.Optional[typing.Tuple[str, InlineKeyboardMarkup]]`
+        """
+        if 0 <= page < len(self.pages):
+            return self.pages[page]
+
+        return None
+
+
+class WordIndex:
+    """
+    Base words search index class
+
+    Entries are found by word prefix in German and Russian: tokens are
+    kept sorted, so the tokens starting with a prefix are one bisected
+    range of the table, as the subtree of a prefix trie. Queries of
+    three or more letters also find entries containing them anywhere,
+    through a trigram index. Results and their rendered inline answers
+    are cached per query, so typing a word letter by letter costs one
+    lookup per prefix.
+
+    Misspelled words are found by edit distance: candidate tokens of a
+    similar length sharing enough trigrams with the query are counted
+    from a precomputed index, and only the best of them are compared.
+    """
+
+    def __init__(self, words: typing.Sequence, limit: int = 100, cache_size: int = 1000) -> None:
+        """
+        :param words: Words with translation
+        :type words: :obj:`typing.Sequence[Word]`
+        :param limit: Maximum number of results
+        :type limit: :obj:`int`
+        :param cache_size: Maximum number of cached queries
+        :type cache_size: :obj:`int`
+        """
+        self.words = tuple(words)
+        self.limit = limit
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        # normalised "word\ntranslation" by word index, checked by substring search
+        self.texts = []
+        # token -> word indexes
+        postings = {}
+        # trigram -> word indexes
+        trigrams = {}
+
+        for num, word in enumerate(self.words):
+            text = f'{WordIndex.normalise(word.word)}\n{WordIndex.normalise(word.translation)}'
+            self.texts.append(text)
+
+            for token in set(TOKEN.findall(text)) - STOP_TOKENS:
+                postings.setdefault(token, []).append(num)
+
+            for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                trigrams.setdefault(trigram, []).append(num)
+
+        self.tokens = sorted(postings)
+        self.lengths = [len(token) for token in self.tokens]
+        self.postings = [tuple(postings[token]) for token in self.tokens]
+        self.trigrams = {trigram: frozenset(nums) for trigram, nums in trigrams.items()}
+
+        # (trigram of the padded token, token length) -> token indexes
+        self.grams = {}
+
+        for i, token in enumerate(self.tokens):
+            for gram in WordIndex.grams(token):
+                self.grams.setdefault((gram, len(token)), []).append(i)
+
+    def normalise(text: str) -> str:
+        """
+        Use this method to normalise text for search
+
+        :param text: Text
+        :type text: :obj:`str`
+
+        :return: Returns the case and umlaut folded text
+        :rtype: :obj:`str`
+        """
+        return text.casefold().translate(FOLD)
+
+    def grams(token: str) -> set:
+        """
+        Use this method to get the trigrams of a token padded at both ends
+
+        :param token: Normalised token
+        :type token: :obj:`str`
+
+        :return: Returns the trigrams
+        :rtype: :obj:`set`
+        """
+        padded = f'  {token}  '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def positions(text: str) -> dict:
+        """
+        Use this method to get bit masks of letter positions in a string
+
+        :param text: String
+        :type text: :obj:`str`
+
+        :return: Returns masks by letter
+        :rtype: :obj:`typing.Dict[str, int]`
+        """
+        positions = {}
+
+        for i, char in enumerate(text):
+            positions[char] = positions.get(char, 0) | 1 << i
+
+        return positions
+
+    def distance(a: str, b: str, limit: int, positions: dict = None) -> int:
+        """
+        Use this method to count the edits turning one string into another,
+        a swap of adjacent letters counts as one edit
+
+        The distance is computed bit-parallel, one integer operation per
+        letter of the second string handles all letters of the first.
+
+        :param a: First string
+        :type a: :obj:`str`
+        :param b: Second string
+        :type b: :obj:`str`
+        :param limit: Maximum distance of interest
+        :type limit: :obj:`int`
+        :param positions: Letter positions of the first string, when comparing
+            it with many strings
+        :type positions: :obj:`typing.Optional[typing.Dict[str, int]]`
+
+        :return: Returns the distance, limit + 1 if it is greater than the limit
+        :rtype: :obj:`int`
+        """
+        if abs(len(a) - len(b)) > limit:
+            return limit + 1
+
+        if not a:
+            return min(len(b), limit + 1)
+
+        if positions is None:
+            positions = WordIndex.positions(a)
+
+        last = 1 << (len(a) - 1)
+        distance = len(a)
+        vp, vn, d0, pm_before = (1 << len(a)) - 1, 0, 0, 0
+
+        for char in b:
+            pm = positions.get(char, 0)
+            tr = ((~d0 & pm) << 1) & pm_before
+            d0 = (((pm & vp) + vp) ^ vp) | pm | vn | tr
+            hp = vn | ~(d0 | vp)
+            hn = d0 & vp
+
+            if hp & last:
+                distance += 1
+            elif hn & last:
+                distance -= 1
+
+            hp = (hp << 1) | 1
+            vp = (hn << 1) | ~(d0 | hp)
+            vn = hp & d0
+            pm_before = pm
+
+        return min(distance, limit + 1)
+
+    def similar(self, token: str) -> dict:
+        """
+        Use this method to find indexed tokens close to a token
+
+        Up to one edit is allowed in tokens of four to seven letters and
+        two edits in longer ones. Trigrams shared by many tokens are not
+        counted once a rarer one has found candidates.
+
+        :param token: Normalised token
+        :type token: :obj:`str`
+
+        :return: Returns distances by token index
+        :rtype: :obj:`typing.Dict[int, int]`
+        """
+        limit = 0 if len(token) < 4 else 1 if len(token) < 8 else 2
+        postings = sorted(
+            ([self.grams.get((gram, length), ())
+              for length in range(len(token) - limit, len(token) + limit + 1)]
+             for gram in WordIndex.grams(token)),
+            key=lambda lists: sum(map(len, lists)))
+
+        # an edit changes at most three trigrams and a swap of adjacent
+        # letters four, so a close token shares at least this many, and
+        # one of them is not among the least - 1 most common trigrams
+        least = max(1, len(postings) - 4 * limit)
+        shared = Counter()
+
+        for lists in postings[:len(postings) - least + 1]:
+            # common trigrams cost the most to count and tell the least,
+            # skipping them bounds the search time at a small loss of recall
+            if shared and sum(map(len, lists)) > FUZZY_POSTINGS:
+                break
+
+            for nums in lists:
+                shared.update(nums)
+
+        candidates = list(shared)
+
+        if len(candidates) > FUZZY_CANDIDATES:
+            candidates = heapq.nlargest(FUZZY_CANDIDATES, candidates, key=shared.__getitem__)
+
+        positions = WordIndex.positions(token)
+        distances = {}
+
+        for i in candidates:
+            distance = WordIndex.distance(token, self.tokens[i], limit, positions)
+
+            if distance <= limit:
+                distances[i] = distance
+
+        return distances
+
+    def closest(self, query: str, count: int = 10) -> tuple:
+        """
+        Use this method to find the words closest to a query, which may be misspelled
+
+        Entries are ranked by the number of query words they match, then
+        by the total edit distance of the matched words.
+
+        :param query: Search query
+        :type query: :obj:`str`
+        :param count: Maximum number of results
+        :type count: :obj:`int`
+
+        :return: Returns matching words, closest first
+        :rtype: :obj:`typing.Tuple[Word, ...]`
+        """
+        tokens = [token for token in TOKEN.findall(WordIndex.normalise(query))
+                  if token not in STOP_TOKENS][:FUZZY_QUERY_WORDS]
+
+        # word index -> [matched query words, total distance]
+        scores = {}
+
+        for token in tokens:
+            best = {}
+
+            for i, distance in self.similar(token).items():
+                for num in self.postings[i]:
+                    if distance < best.get(num, distance + 1):
+                        best[num] = distance
+
+            for num, distance in best.items():
+                score = scores.setdefault(num, [0, 0])
+                score[0] += 1
+                score[1] += distance
+
+        ranked = heapq.nsmallest(
+            count, scores, key=lambda num: (-scores[num][0], scores[num][1], num))
+
+        return tuple(self.words[num] for num in ranked)
+
+    def prefix(self, prefix: str, found: dict):
+        """
+        Use this method to add entries with a word starting with the prefix,
+        shorter words first
+
+        :param prefix: Normalised prefix
+        :type prefix: :obj:`str`
+        :param found: Found word indexes, in result order
+        :type found: :obj:`dict`
+        """
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + '\U0010ffff', start)
+
+        ranked = heapq.nsmallest(
+            self.limit, range(start, end), key=self.lengths.__getitem__)
+
+        for i in ranked:
+            for num in self.postings[i]:
+                found.setdefault(num, None)
+
+                if len(found) >= self.limit:
+                    return
+
+    def substring(self, query: str, found: dict):
+        """
+        Use this method to add entries containing the query
+
+        :param query: Normalised query, at least three characters long
+        :type query: :obj:`str`
+        :param found: Found word indexes, in result order
+        :type found: :obj:`dict`
+        """
+        postings = []
+
+        for i in range(len(query) - 2):
+            nums = self.trigrams.get(query[i:i + 3])
+
+            if nums is None:
+                return
+
+            postings.append(nums)
+
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        for num in sorted(candidates):
+            if num not in found and query in self.texts[num]:
+                found[num] = None
+
+                if len(found) >= self.limit:
+                    return
+
+    def lookup(self, query: str) -> list:
+        """
+        Use this method to get the cache entry of a query
+
+        :param query: Search query
+        :type query: :obj:`str`
+
+        :return: Returns matching words and their rendered inline pages by offset
+        :rtype: :obj:`list`
+        """
+        query = ' '.join(TOKEN.findall(WordIndex.normalise(query)))
+        entry = self.cache.get(query)
+
+        if entry is not None:
+            self.cache.move_to_end(query)
+            return entry
+
+        found = {}
+
+        if not query:
+            found = dict.fromkeys(range(min(self.limit, len(self.words))))
+        else:
+            if ' ' not in query:
+                self.prefix(query, found)
+
+            if len(found) < self.limit and len(query) >= 3:
+                self.substring(query, found)
+
+        entry = [tuple(self.words[num] for num in found), {}]
+        self.cache[query] = entry
+
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return entry
+
+    def search(self, query: str) -> tuple:
+        """
+        Use this method to find words
+
+        :param query: Search query
+        :type query: :obj:`str`
+
+        :return: Returns matching words, best matches first
+        :rtype: :obj:`typing.Tuple[Word, ...]`
+        """
+        return self.lookup(query)[0]
+
+    def inline(self, query: str, offset: int = 0, count: int = 50):
+        """
+        Use this method to get a page of inline query results
+
+        :param query: Search query
+        :type query: :obj:`str`
+        :param offset: Index of the first result
+        :type offset: :obj:`int`
+        :param count: Maximum number of results per page
+        :type count: :obj:`int`
+
+        :return: Returns the results serialized for answerInlineQuery and
+            the next page offset, empty for the last page
+        :rtype: :obj:`typing.Tuple[str, str]`
+        """
+        words, pages = self.lookup(query)
+        # offsets come from clients, pages past the end are all the same
+        offset = max(0, min(offset, len(words)))
+        page = pages.get(offset)
+
+        if page is None:
+            end = offset + count
+            results = [
+                types.InlineQueryResultArticle(
+                    id=str(num),
+                    title=word.word,
+                    description=word.translation,
+                    input_message_content=types.InputTextMessageContent(word.text)).to_python()
+                for num, word in enumerate(words[offset:end], offset)]
+
+            page = (json.dumps(results, ensure_ascii=False),
+                    str(end) if end < len(words) else '')
+            pages[offset] = page
+
+        return page
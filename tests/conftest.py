@@ -0,0 +1,4 @@
+import os
+
+# the repository root is the bot module, importing it needs a well-formed token
+os.environ.setdefault('BOT_TOKEN', '123456:test')
@@ -0,0 +1,102 @@
+import unittest
+from types import SimpleNamespace
+
+import src.callbacks as callbacks
+from src.callbacks import CallbackData, CallbackRouter
+
+# argument types of the bot routes, by prefix
+ROUTES = {
+    callbacks.MENU_TALK: (),
+    callbacks.MENU_WRITE: (),
+    callbacks.MENU_LISTEN: (),
+    callbacks.MENU_READ: (),
+    callbacks.TALK_NEXT: (int,),
+    callbacks.TALK_ANSWER: (int,),
+    callbacks.WRITE_NEXT: (int,),
+    callbacks.WRITE_ANSWER: (int,),
+    callbacks.LISTEN_NEXT: (int,),
+    callbacks.LISTEN_ANSWERS: (int,),
+    callbacks.READ_NEXT: (int,),
+    callbacks.READ_RESULT: (int, bool),
+    callbacks.WORDS_PAGE: (int,),
+}
+
+# callback data of keyboards sent before versioning -> prefix and typed arguments
+LEGACY_DATA = {
+    'menu_main_talk': (callbacks.MENU_TALK, []),
+    'menu_main_write': (callbacks.MENU_WRITE, []),
+    'menu_main_listen': (callbacks.MENU_LISTEN, []),
+    'menu_main_read': (callbacks.MENU_READ, []),
+    'talk_4': (callbacks.TALK_NEXT, [4]),
+    'talk_answer_0': (callbacks.TALK_ANSWER, [0]),
+    'write_12': (callbacks.WRITE_NEXT, [12]),
+    'write_answer_7': (callbacks.WRITE_ANSWER, [7]),
+    'listen_2': (callbacks.LISTEN_NEXT, [2]),
+    'listen_answers_5': (callbacks.LISTEN_ANSWERS, [5]),
+    'read_9': (callbacks.READ_NEXT, [9]),
+    'read_3_correct': (callbacks.READ_RESULT, [3, True]),
+    'read_3_wrong': (callbacks.READ_RESULT, [3, False]),
+    'words_1': (callbacks.WORDS_PAGE, [1]),
+}
+
+
+def callback(data: str) -> SimpleNamespace:
+    return SimpleNamespace(data=data)
+
+
+class CallbacksTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.router = CallbackRouter(stale_toast='stale')
+
+        for prefix, arg_types in ROUTES.items():
+            async def handler(call, *args, prefix=prefix):
+                return prefix, list(args)
+
+            self.router.route(prefix, *arg_types)(handler)
+
+    def test_every_prefix_is_tested(self):
+        prefixes = {value for name, value in vars(callbacks).items()
+                    if name.isupper() and isinstance(value, str) and name != 'VERSION'}
+
+        self.assertEqual(prefixes, set(ROUTES))
+
+    def test_every_legacy_entry_is_tested(self):
+        tested = {tuple(word for word in data.split('_') if not word.isdigit())
+                  for data in LEGACY_DATA}
+
+        self.assertEqual(tested, set(callbacks.LEGACY))
+
+    async def test_legacy_data(self):
+        for data, expected in LEGACY_DATA.items():
+            with self.subTest(data=data):
+                self.assertEqual(await self.router.dispatch(callback(data)), expected)
+
+    async def test_round_trip(self):
+        values = {int: 42, bool: True}
+
+        for prefix, arg_types in ROUTES.items():
+            args = [values[arg_type] for arg_type in arg_types]
+            data = CallbackData.pack(prefix, *args)
+
+            with self.subTest(data=data):
+                self.assertEqual(data[0], callbacks.VERSION)
+                self.assertEqual(CallbackData.unpack(data), (prefix, [str(int(arg)) for arg in args]))
+                self.assertEqual(await self.router.dispatch(callback(data)), (prefix, args))
+
+        self.assertEqual(
+            await self.router.dispatch(callback(CallbackData.pack(callbacks.READ_RESULT, 0, False))),
+            (callbacks.READ_RESULT, [0, False]))
+
+    async def test_unknown_data(self):
+        for data in ('', '1zz', '1zz:1', 'unknown_3', '9rr:1:1', '1rr:1', '1rr:x:1', '1tn:1:2'):
+            with self.subTest(data=data):
+                self.assertIsNone(self.router.resolve(callback(data)))
+                self.assertIsNone(await self.router.dispatch(callback(data)))
+
+        self.assertEqual(self.router.toast(callback('1zz')), 'stale')
+        self.assertIsNone(self.router.toast(callback('read_3_correct')))
+
+    def test_data_length_limit(self):
+        with self.assertRaises(ValueError):
+            CallbackData.pack(callbacks.WORDS_PAGE, 'x' * callbacks.MAX_DATA_LENGTH)
@@ -0,0 +1,32 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import src.config as config
+from src.content import Content
+
+
+class ContentWatchTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_reload_keeps_watching(self):
+        calls = []
+
+        async def reload():
+            calls.append(len(calls))
+
+            if len(calls) == 1:
+                raise KeyError('Write')
+
+            return False
+
+        with mock.patch.object(config, 'CONTENT_SCAN_INTERVAL', 0.01), \
+                mock.patch.object(Content, 'reload', reload):
+            task = asyncio.get_running_loop().create_task(Content.watch())
+
+            with self.assertLogs('src.content', 'ERROR'):
+                await asyncio.sleep(0.1)
+
+            self.assertFalse(task.done())
+            self.assertGreater(len(calls), 1)
+
+            task.cancel()
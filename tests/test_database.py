@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import src.database as database
+from src.database import Database
+from src.pool import ConnectionPool, WriteBuffer
+
+
+class UserAnswersTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.pool, self.buffer = database.pool, database.answers_buffer
+
+        database.pool = ConnectionPool(os.path.join(self.dir.name, 'users.db'), 2)
+        database.answers_buffer = WriteBuffer(database.pool, self.buffer.sql, 0.001)
+
+        await Database.create()
+
+    async def asyncTearDown(self):
+        await Database.close()
+
+        database.pool, database.answers_buffer = self.pool, self.buffer
+        self.dir.cleanup()
+
+    async def add_answers(self, count: int):
+        await asyncio.gather(*[Database.answers.add(1, message_id, 'write', 0, 'Antwort')
+                               for message_id in range(count)])
+
+    async def test_close_writes_buffered_answers(self):
+        database.answers_buffer = WriteBuffer(database.pool, self.buffer.sql, 60)
+        adds = [asyncio.ensure_future(Database.answers.add(1, message_id, 'write', 0, 'Antwort'))
+                for message_id in range(3)]
+
+        await asyncio.sleep(0)
+        await Database.close()
+
+        await asyncio.gather(*adds)
+
+        with sqlite3.connect(os.path.join(self.dir.name, 'users.db')) as connection:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM user_answers').fetchone()[0], 3)
+
+    async def test_abandoned_review(self):
+        await self.add_answers(3)
+
+        answers = await Database.answers.claim_many(10, 3, 0.05)
+        self.assertTrue(await Database.answers.renew(answers[0][0], 10, 0.05))
+        await Database.answers.remove(answers[0][0], 10)
+
+        # the admin leaves the batch, its leases expire
+        await asyncio.sleep(0.1)
+
+        self.assertFalse(await Database.answers.renew(answers[1][0], 10))
+        self.assertEqual(await Database.answers.count(), {'queued': 2, 'claimed': 0})
+
+        claimed = await Database.answers.claim_many(11, 3)
+        self.assertEqual([answer[0] for answer in claimed], [answers[1][0], answers[2][0]])
+
+    async def test_endless_leases_are_removed(self):
+        await self.add_answers(2)
+        await database.pool.execute(
+            'UPDATE user_answers SET claimed_by = 10, claimed_until = ? WHERE ID = 1', [float('inf')])
+
+        await Database.create()
+
+        self.assertEqual(await Database.answers.count(), {'queued': 1, 'claimed': 0})
+
+    async def test_concurrent_claims_are_disjoint_and_fifo(self):
+        await self.add_answers(10)
+
+        first, second = await asyncio.gather(
+            Database.answers.claim_many(10, 4), Database.answers.claim_many(11, 4))
+        first, second = [answer[0] for answer in first], [answer[0] for answer in second]
+
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(sorted(first + second), list(range(1, 9)))
+        self.assertEqual(first, sorted(first))
+        self.assertEqual(second, sorted(second))
+
+        rest = await Database.answers.claim_many(12, 4)
+        self.assertEqual([answer[0] for answer in rest], [9, 10])
+
+    async def test_expired_leases_are_claimed_again(self):
+        await self.add_answers(3)
+
+        await Database.answers.claim_many(10, 2, 0.05)
+        self.assertEqual([answer[0] for answer in await Database.answers.claim_many(11, 3)], [3])
+
+        await asyncio.sleep(0.1)
+
+        self.assertEqual([answer[0] for answer in await Database.answers.claim_many(12, 3)], [1, 2])
+        self.assertEqual(await Database.answers.count(), {'queued': 0, 'claimed': 3})
+
+    async def test_claim_uses_queue_index(self):
+        plan = await database.pool.fetchall(
+            '''
+            EXPLAIN QUERY PLAN
+            SELECT ID, chat_id, message_id, task_type, task_num, answer FROM user_answers
+            WHERE claimed_until = 0
+            ORDER BY ID
+            LIMIT 1
+            ''')
+
+        self.assertIn('USING INDEX user_answers_queue', plan[0][3])
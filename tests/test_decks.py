@@ -0,0 +1,57 @@
+import random
+import unittest
+from collections import Counter
+
+from src.decks import Decks
+
+USERS = 5000
+
+
+class DecksTest(unittest.TestCase):
+
+    def setUp(self):
+        # deck seeds are random, a fixed generator keeps the statistics reproducible
+        random.seed(USERS)
+
+    def deal(self, size: int, users: int = USERS, cards: int = None) -> list:
+        """
+        Use this method to deal the first cards of a deck to every user
+        """
+        decks = Decks(('Read',))
+
+        return [tuple(decks.draw(user_id, 'Read', size) for _ in range(cards or size))
+                for user_id in range(users)]
+
+    def test_deck_is_permutation(self):
+        for size in (2, 3, 10, 50, 257):
+            for order in self.deal(size, users=100):
+                self.assertEqual(sorted(order), list(range(size)))
+
+    def test_first_card_is_uniform(self):
+        for size in (10, 50):
+            first = Counter(order[0] for order in self.deal(size, cards=1))
+            expected = USERS / size
+
+            self.assertEqual(len(first), size)
+
+            for count in first.values():
+                self.assertLess(abs(count - expected), expected * 0.35)
+
+    def test_orders_differ_across_seeds(self):
+        orders = Counter(self.deal(10))
+
+        self.assertGreater(len(orders), USERS * 0.95)
+        self.assertLess(max(orders.values()), 5)
+
+    def test_last_task_is_not_repeated(self):
+        decks = Decks(('Read',))
+        task = None
+
+        for _ in range(1000):
+            new_task = decks.draw(1, 'Read', 5, task)
+            self.assertNotEqual(new_task, task)
+            task = new_task
+
+
+if __name__ == '__main__':
+    unittest.main()
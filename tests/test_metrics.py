@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from src.metrics import ACK, SEND_QUEUE, Metrics
+from src.middlewares import CallbackAckMiddleware
+from src.sender import BULK, SendScheduler
+
+
+class AnswerBot:
+
+    async def answer_callback_query(self, callback_query_id: str, text: str = None):
+        await asyncio.sleep(0)
+
+
+class MetricsTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        for histograms in Metrics.histograms.values():
+            histograms.clear()
+
+    async def test_send_queue_wait_is_exported(self):
+        scheduler = SendScheduler(rate=1000, chat_rate=1000, chat_burst=1)
+
+        await asyncio.gather(*[scheduler.acquire(1) for _ in range(3)],
+                             scheduler.acquire(2, BULK))
+
+        text = await Metrics.render()
+
+        self.assertEqual(Metrics.histograms[SEND_QUEUE]['interactive'].count, 3)
+        self.assertIn(f'{SEND_QUEUE}_count{{priority="bulk"}} 1', text)
+        self.assertEqual(scheduler.waiting, 0)
+
+    async def test_callback_ack_latency_is_exported(self):
+        ack = CallbackAckMiddleware()
+        update = SimpleNamespace(callback_query=SimpleNamespace(id='1', bot=AnswerBot()))
+
+        await ack.on_pre_process_update(update, {})
+        await asyncio.gather(*ack.tasks)
+
+        text = await Metrics.render()
+
+        self.assertIn(f'{ACK}_count{{result="answered"}} 1', text)
+        self.assertFalse(ack.tasks)
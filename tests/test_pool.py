@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.pool import ConnectionPool, WriteBuffer
+
+INSERT = 'INSERT INTO rows(value) VALUES(?)'
+
+
+class WriteBufferTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'test.db')
+        self.pool = ConnectionPool(self.path, 2, 'FULL')
+        self.commits = []
+
+        await self.pool.execute('CREATE TABLE rows(value INTEGER NOT NULL)')
+
+        executemany = self.pool.executemany
+
+        async def record_commit(sql: str, seq_of_parameters):
+            result = await executemany(sql, seq_of_parameters)
+            self.commits.append(list(seq_of_parameters))
+            return result
+
+        self.pool.executemany = record_commit
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.dir.cleanup()
+
+    def stored(self) -> list:
+        with sqlite3.connect(self.path) as connection:
+            return [row[0] for row in connection.execute('SELECT value FROM rows ORDER BY value')]
+
+    async def test_concurrent_adds_share_one_commit(self):
+        buffer = WriteBuffer(self.pool, INSERT, 0.01)
+        resolved = []
+
+        async def add(value: int):
+            await buffer.add([value])
+            # the row is committed before its writer resumes
+            resolved.append((value, len(self.commits), value in self.stored()))
+
+        await asyncio.gather(*[add(value) for value in range(20)])
+
+        self.assertEqual(self.commits, [[[value] for value in range(20)]])
+        self.assertEqual(sorted(resolved), [(value, 1, True) for value in range(20)])
+
+    async def test_full_buffer_is_written_at_once(self):
+        buffer = WriteBuffer(self.pool, INSERT, 60, 5)
+
+        await asyncio.wait_for(asyncio.gather(*[buffer.add([value]) for value in range(10)]), 5)
+
+        self.assertEqual([len(rows) for rows in self.commits], [5, 5])
+        self.assertEqual(self.stored(), list(range(10)))
+
+    async def test_flush_writes_pending_rows(self):
+        buffer = WriteBuffer(self.pool, INSERT, 60)
+        adds = [asyncio.ensure_future(buffer.add([value])) for value in range(3)]
+
+        await asyncio.sleep(0)
+        self.assertFalse(any(add.done() for add in adds))
+
+        await buffer.flush()
+        await asyncio.gather(*adds)
+
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(self.stored(), [0, 1, 2])
+
+    async def test_failed_batch_raises_to_every_writer(self):
+        buffer = WriteBuffer(self.pool, 'INSERT INTO missing(value) VALUES(?)', 0.01)
+
+        results = await asyncio.gather(*[buffer.add([value]) for value in range(3)],
+                                       return_exceptions=True)
+
+        self.assertEqual(len(results), 3)
+
+        for result in results:
+            self.assertIsInstance(result, sqlite3.OperationalError)
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from src.storage import SQLiteStorage
+
+
+class SQLiteStorageTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorage(os.path.join(self.dir.name, 'storage.db'), ttl=60)
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        self.dir.cleanup()
+
+    async def stored(self) -> int:
+        return (await self.storage.pool.fetchone('SELECT COUNT(*) FROM states'))[0]
+
+    async def test_expired_records_are_purged_in_the_background(self):
+        await self.storage.set_state(chat=1, user=1, state='old')
+        await self.storage.pool.execute('UPDATE states SET updated = ?', [time.time() - 120])
+
+        # a write does not pay for the purge
+        await self.storage.set_state(chat=2, user=2, state='new')
+        self.assertEqual(await self.stored(), 2)
+
+        self.storage.start()
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(await self.stored(), 1)
+        self.assertEqual(await self.storage.get_state(chat=2, user=2), 'new')
+
+        await self.storage.close()
+        self.assertIsNone(self.storage.task)
+
+    async def test_get_data_default(self):
+        default = {'page': 1}
+
+        self.assertEqual(await self.storage.get_data(chat=1, user=1), {})
+        self.assertEqual(await self.storage.get_data(chat=1, user=1, default=default), default)
+        self.assertIsNot(await self.storage.get_data(chat=1, user=1, default=default), default)
+
+        await self.storage.set_data(chat=1, user=1, data={'page': 2})
+        self.assertEqual(await self.storage.get_data(chat=1, user=1, default=default), {'page': 2})
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from aiogram import types
+
+import src.config as config
+from src.tgfiles import TGFile
+
+
+def message(file_id: str) -> SimpleNamespace:
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+class TGFileSendTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        os.chdir(self.dir.name)
+
+        for folder in ('data/img', 'data/vid', 'data/json'):
+            os.makedirs(folder)
+
+        for file in ('a.jpg', 'b.jpg'):
+            with open(f'data/img/{file}', 'wb') as img_file:
+                img_file.write(b'\xff\xd8')
+
+        self.files = mock.patch.object(config, 'FILES', {}, create=True)
+        self.files.start()
+        await TGFile.index.refresh()
+
+        self.uploads = []
+
+    async def asyncTearDown(self):
+        await TGFile.store.close()
+        self.files.stop()
+
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    async def send(self, photo):
+        await asyncio.sleep(0.01)
+
+        if isinstance(photo, types.InputFile):
+            self.uploads.append(os.path.basename(photo.filename))
+            return message(f'id-{len(self.uploads)}')
+
+        return message(photo)
+
+    async def send_group(self, photos: list):
+        return [await self.send(photo) for photo in photos]
+
+    async def test_group_and_single_send_upload_once(self):
+        group, single = await asyncio.gather(
+            TGFile.send.img_group(['a.jpg', 'b.jpg'], self.send_group),
+            TGFile.send.img('a.jpg', self.send))
+
+        self.assertEqual(sorted(self.uploads), ['a.jpg', 'b.jpg'])
+        self.assertEqual(single.photo[-1].file_id, group[0].photo[-1].file_id)
+        self.assertFalse(TGFile.send.uploads)
+
+    async def test_groups_of_the_same_images(self):
+        await asyncio.wait_for(asyncio.gather(
+            TGFile.send.img_group(['a.jpg', 'b.jpg'], self.send_group),
+            TGFile.send.img_group(['b.jpg', 'a.jpg'], self.send_group)), 5)
+
+        self.assertEqual(sorted(self.uploads), ['a.jpg', 'b.jpg'])
+
+    async def test_failed_group_releases_uploads(self):
+        async def fail(photos: list):
+            raise RuntimeError('Bad Request')
+
+        with self.assertRaises(RuntimeError):
+            await TGFile.send.img_group(['a.jpg'], fail)
+
+        self.assertFalse(TGFile.send.uploads)
+        await TGFile.send.img('a.jpg', self.send)
+        self.assertEqual(self.uploads, ['a.jpg'])
+
+
+class TGFileIndexTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_scan_keeps_watching(self):
+        scans = []
+
+        async def refresh():
+            scans.append(len(scans))
+
+            if len(scans) == 1:
+                raise FileNotFoundError('data/img')
+
+        with mock.patch.object(config, 'MEDIA_SCAN_INTERVAL', 0.01), \
+                mock.patch.object(TGFile.index, 'refresh', refresh):
+            task = asyncio.get_running_loop().create_task(TGFile.index.watch())
+
+            with self.assertLogs('src.tgfiles', 'ERROR'):
+                await asyncio.sleep(0.1)
+
+            self.assertFalse(task.done())
+            self.assertGreater(len(scans), 1)
+
+            task.cancel()
+
+
+class TGFileStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_write_is_retried(self):
+        writes = []
+
+        def write(path: str, data: str):
+            writes.append(path)
+
+            if len(writes) == 1:
+                raise OSError(28, 'No space left on device')
+
+        with mock.patch.object(config, 'FILES_FLUSH_DELAY', 0.01), \
+                mock.patch.object(config, 'FILES', {}, create=True), \
+                mock.patch.object(TGFile.store, 'write', write):
+            TGFile.store.schedule()
+
+            with self.assertLogs('src.tgfiles', 'ERROR'):
+                await asyncio.sleep(0.1)
+
+            self.assertEqual(len(writes), 2)
+            self.assertFalse(TGFile.store.dirty)
+            self.assertIsNone(TGFile.store.task)